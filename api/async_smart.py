@@ -0,0 +1,108 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncSmart:
+    """
+    Asyncio counterpart to Smart exposing the same endpoint methods as coroutines.
+    Each call runs the blocking Smart method on a worker thread, so requests share Smart's pooled session,
+    response cache and retry handling. At most `concurrency` requests are in flight at once.
+    """
+
+    def __init__(self, smart, concurrency=4):
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1")
+        self.smart = smart
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='async-smart')
+        self._semaphore = None
+
+    async def _call(self, method, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+    async def game_rotation(self, *args, **kwargs):
+        return await self._call(self.smart.game_rotation, *args, **kwargs)
+
+    async def team_season_totals(self, *args, **kwargs):
+        return await self._call(self.smart.team_season_totals, *args, **kwargs)
+
+    async def player_season_totals(self, *args, **kwargs):
+        return await self._call(self.smart.player_season_totals, *args, **kwargs)
+
+    async def player_season_tracking(self, *args, **kwargs):
+        return await self._call(self.smart.player_season_tracking, *args, **kwargs)
+
+    async def team_season_tracking(self, *args, **kwargs):
+        return await self._call(self.smart.team_season_tracking, *args, **kwargs)
+
+    async def season_tracking_stats(self, *args, **kwargs):
+        return await self._call(self.smart.season_tracking_stats, *args, **kwargs)
+
+    async def shooting_dashboard(self, *args, **kwargs):
+        return await self._call(self.smart.shooting_dashboard, *args, **kwargs)
+
+    async def box_score_traditional(self, *args, **kwargs):
+        return await self._call(self.smart.box_score_traditional, *args, **kwargs)
+
+    async def box_score_advanced(self, *args, **kwargs):
+        return await self._call(self.smart.box_score_advanced, *args, **kwargs)
+
+    async def get_season_traditional_box_score(self, *args, **kwargs):
+        return await self._call(self.smart.get_season_traditional_box_score, *args, **kwargs)
+
+    async def get_season_advanced_box_score(self, *args, **kwargs):
+        return await self._call(self.smart.get_season_advanced_box_score, *args, **kwargs)
+
+    async def win_probability(self, *args, **kwargs):
+        return await self._call(self.smart.win_probability, *args, **kwargs)
+
+    async def get_player_game_log(self, *args, **kwargs):
+        return await self._call(self.smart.get_player_game_log, *args, **kwargs)
+
+    async def get_teams_game_log(self, *args, **kwargs):
+        return await self._call(self.smart.get_teams_game_log, *args, **kwargs)
+
+    async def play_by_play(self, *args, **kwargs):
+        return await self._call(self.smart.play_by_play, *args, **kwargs)
+
+    async def get_defensive_matchups(self, *args, **kwargs):
+        return await self._call(self.smart.get_defensive_matchups, *args, **kwargs)
+
+    async def get_shot_chart_detail(self, *args, **kwargs):
+        return await self._call(self.smart.get_shot_chart_detail, *args, **kwargs)
+
+    async def get_foul_chart_detail(self, *args, **kwargs):
+        return await self._call(self.smart.get_foul_chart_detail, *args, **kwargs)
+
+    async def get_shot_chart_detail_data(self, *args, **kwargs):
+        return await self._call(self.smart.get_shot_chart_detail_data, *args, **kwargs)
+
+    async def api_call(self, *args, **kwargs):
+        return await self._call(self.smart.api_call, *args, **kwargs)
+
+    async def _gather(self, fetch, items):
+        # The semaphore is bound to the running event loop, so create a fresh one for every run
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[fetch(self, item) for item in items], return_exceptions=True)
+
+    def iter_results(self, fetch, items, chunk_size=None):
+        """
+        Runs the coroutine function fetch(async_smart, item) for every item, `chunk_size` items at a time, and
+        yields (item, result) in input order. Failed fetches yield the raised exception as the result.
+        """
+        items = list(items)
+        if chunk_size is None:
+            chunk_size = self.concurrency * 4
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            results = asyncio.run(self._gather(fetch, chunk))
+            for item, result in zip(chunk, results):
+                yield item, result
+
+    def close(self):
+        self._executor.shutdown(wait=True)
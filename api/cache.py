@@ -0,0 +1,252 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from api.decode import loads
+
+
+# GAME_STATUS_ID of a finished game, and the EVENTMSGTYPE of the play by play event that ends a period
+FINAL_STATUS = 3
+END_OF_PERIOD = 13
+REGULATION_PERIODS = 4
+
+# Endpoints whose responses describe a single game. These never change once the game is over.
+GAME_ENDPOINTS = {
+    'boxscoreadvancedv2',
+    'boxscoretraditionalv2',
+    'gamerotation',
+    'playbyplayv2',
+    'winprobabilitypbp',
+}
+
+# League wide endpoints whose current season responses change as games are played.
+LEAGUE_ENDPOINTS = {
+    'leaguedashplayerstats',
+    'leaguedashptstats',
+    'leaguedashteamstats',
+    'leaguegamelog',
+    'leagueseasonmatchups',
+    'playerdashptshots',
+    'playergamelogs',
+    'shotchartdetail',
+}
+
+NEVER_EXPIRES = None
+# A game of the current season that is not over yet, or may not be, is refetched after this
+LIVE_GAME_TTL = 5 * 60
+CURRENT_SEASON_TTL = 60 * 60
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+
+class CacheMissError(Exception):
+    pass
+
+
+def season_of_game(game_id):
+    """
+    Returns the season (e.g. 2023-24) a game id such as 0022300001 belongs to, or None if it is not a game id.
+    """
+    game_id = str(game_id)
+    if len(game_id) != 10 or not game_id.isdigit():
+        return None
+    start = int(game_id[3:5])
+    # The league's first season is 1946-47
+    year = 1900 + start if start >= 46 else 2000 + start
+    return '{}-{:02d}'.format(year, (start + 1) % 100)
+
+
+def is_final(content):
+    """
+    Returns whether a game response shows the game is over: a result set with a final GAME_STATUS_ID, or play by play
+    whose last event ends the fourth period or an overtime with the score not tied.
+    """
+    try:
+        sets = loads(content)['resultSets']
+    except Exception:
+        return False
+    for s in sets:
+        headers = s.get('headers')
+        rows = s.get('rowSet') or []
+        if not isinstance(headers, list) or not rows:
+            continue
+        if 'GAME_STATUS_ID' in headers:
+            index = headers.index('GAME_STATUS_ID')
+            if all(row[index] == FINAL_STATUS for row in rows):
+                return True
+        if {'EVENTMSGTYPE', 'PERIOD', 'SCOREMARGIN'} <= set(headers):
+            last = rows[-1]
+            if last[headers.index('EVENTMSGTYPE')] != END_OF_PERIOD or \
+                    last[headers.index('PERIOD')] < REGULATION_PERIODS:
+                continue
+            margin = headers.index('SCOREMARGIN')
+            margins = [row[margin] for row in rows if row[margin] not in (None, '')]
+            if margins and margins[-1] != 'TIE':
+                return True
+    return False
+
+
+class ResponseCache:
+    """
+    On disk cache of raw stats.nba.com responses keyed on endpoint + normalized params.
+    Responses are stored gzip compressed, one file per request. The file mtime is the time the response was
+    written (used for TTLs) and the atime is the last time it was read (used for LRU eviction). A current season
+    game response that shows the game is over is stored under a .final name, and never expires.
+    """
+
+    def __init__(self, cache_dir, current_season=None, max_bytes=DEFAULT_MAX_BYTES, ttls=None, cache_only=False):
+        self.cache_dir = cache_dir
+        self.current_season = current_season
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._entries())
+
+    @staticmethod
+    def normalize_params(params):
+        """
+        Returns params as a sorted tuple of (name, str(value)) pairs so equivalent requests share a key.
+        """
+        items = params.items() if isinstance(params, dict) else params
+        return tuple(sorted((str(k), '' if v is None else str(v)) for k, v in items))
+
+    @staticmethod
+    def key(endpoint, params):
+        raw = endpoint + '?' + '&'.join('{}={}'.format(k, v) for k, v in ResponseCache.normalize_params(params))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def path(self, endpoint, params, final=False):
+        suffix = '.final.json.gz' if final else '.json.gz'
+        return os.path.join(self.cache_dir, endpoint, self.key(endpoint, params) + suffix)
+
+    def _past_game(self, params):
+        game_id = dict((k.lower(), v) for k, v in self.normalize_params(params)).get('gameid')
+        season = season_of_game(game_id) if game_id else None
+        return season is not None and self.current_season is not None and season != self.current_season
+
+    def ttl_for(self, endpoint, params):
+        """
+        Returns the TTL in seconds for a request, or None if the response never expires.
+        Explicit per-endpoint TTLs take precedence. Game scoped endpoints never expire for past seasons' games and
+        expire after a few minutes for the current season's, unless the response showed the game was over (see put).
+        League endpoints never expire for past seasons and expire after an hour for the current season.
+        """
+        if endpoint in self.ttls:
+            return self.ttls[endpoint]
+        if endpoint in GAME_ENDPOINTS:
+            if self._past_game(params):
+                return NEVER_EXPIRES
+            return LIVE_GAME_TTL
+        if endpoint in LEAGUE_ENDPOINTS:
+            season = dict((k.lower(), v) for k, v in self.normalize_params(params)).get('season')
+            if season and season != self.current_season:
+                return NEVER_EXPIRES
+            return CURRENT_SEASON_TTL
+        return DEFAULT_TTL
+
+    def get(self, endpoint, params):
+        """
+        Returns the cached raw response content or None. In cache only mode a miss raises CacheMissError.
+        """
+        path = self.path(endpoint, params)
+        ttl = self.ttl_for(endpoint, params)
+        if endpoint in GAME_ENDPOINTS and ttl is not None and endpoint not in self.ttls:
+            final_path = self.path(endpoint, params, final=True)
+            if os.path.exists(final_path):
+                path, ttl = final_path, NEVER_EXPIRES
+        try:
+            stat = os.stat(path)
+            if ttl is not None and time.time() - stat.st_mtime > ttl:
+                content = None
+            else:
+                with gzip.open(path, 'rb') as f:
+                    content = f.read()
+                # Record the access for LRU eviction, keeping mtime as the write time
+                os.utime(path, (time.time(), stat.st_mtime))
+        except (FileNotFoundError, OSError, EOFError):
+            content = None
+
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if content is None and self.cache_only:
+            raise CacheMissError('No cached response for {} {}'.format(endpoint, self.normalize_params(params)))
+        return content
+
+    def put(self, endpoint, params, content):
+        path = self.path(endpoint, params)
+        replaced = None
+        # Only a current season game needs its response checked, past seasons' games never expire anyway
+        if endpoint in GAME_ENDPOINTS and self.ttl_for(endpoint, params) is not None and is_final(content):
+            path, replaced = self.path(endpoint, params, final=True), path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(content)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+        if replaced is not None:
+            self._remove(replaced)
+
+    def invalidate(self, endpoint, params):
+        self._remove(self.path(endpoint, params))
+        self._remove(self.path(endpoint, params, final=True))
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json.gz'):
+                    yield os.path.join(root, name)
+
+    def _evict(self):
+        """
+        Removes least recently used entries until the cache is back under 90% of max_bytes.
+        """
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size_bytes': self._size,
+        }
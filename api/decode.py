@@ -0,0 +1,158 @@
+import gc
+import json
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Columns that are always integral when present. Columns that contain nulls or non integers fall back to pandas
+# inference.
+INTEGER_COLUMNS = {
+    'EVENTMSGACTIONTYPE',
+    'EVENTMSGTYPE',
+    'EVENTNUM',
+    'GAME_EVENT_ID',
+    'LOC_X',
+    'LOC_Y',
+    'MINUTES_REMAINING',
+    'PERIOD',
+    'PLAYER1_ID',
+    'PLAYER2_ID',
+    'PLAYER3_ID',
+    'PLAYER_ID',
+    'PERSON_ID',
+    'SECONDS_REMAINING',
+    'SHOT_ATTEMPTED_FLAG',
+    'SHOT_DISTANCE',
+    'SHOT_MADE_FLAG',
+    'TEAM_ID',
+}
+
+
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+# Whether the outermost paused_gc disabled the collector, so it is only re-enabled if it was enabled before
+_gc_disabled = False
+
+
+@contextmanager
+def paused_gc():
+    """
+    Disables the cyclic garbage collector while decoding. Parsing a large response allocates millions of small
+    objects that would otherwise trigger repeated full collections. Safe to nest and to use from several threads,
+    and leaves the collector disabled if it already was.
+    """
+    global _gc_pauses, _gc_disabled
+    with _gc_lock:
+        _gc_pauses += 1
+        if _gc_pauses == 1:
+            _gc_disabled = gc.isenabled()
+            if _gc_disabled:
+                gc.disable()
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_disabled:
+                _gc_disabled = False
+                gc.enable()
+
+
+def loads(content):
+    """
+    Parses a JSON response body, using orjson when it is installed.
+    """
+    with paused_gc():
+        if orjson is not None:
+            return orjson.loads(content)
+        return json.loads(content)
+
+
+def build_column(header, values):
+    if header in INTEGER_COLUMNS:
+        try:
+            column = values.astype(np.int64)
+            # Only keep the explicit dtype if every value really is an integer, never truncate floats
+            if (column == values).all():
+                return column
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return pd.Series(values).infer_objects()
+
+
+def build_frame(result_set):
+    """
+    Builds a DataFrame from a single {'name', 'headers', 'rowSet'} result set, one column at a time.
+    """
+    headers = result_set['headers']
+    rows = result_set['rowSet']
+    if any(len(row) != len(headers) for row in rows):
+        raise ValueError('Result set {} has rows that do not match its headers'.format(result_set['name']))
+    if len(set(headers)) != len(headers):
+        # Duplicate column names can't be built from a dict, fall back to the row oriented constructor
+        frame = pd.DataFrame(rows)
+        frame.columns = headers
+        return frame
+    with paused_gc():
+        values = np.empty((len(rows), len(headers)), dtype=object)
+        values[:] = rows
+        columns = {header: build_column(header, values[:, i]) for i, header in enumerate(headers)}
+        return pd.DataFrame(columns, copy=False)
+
+
+class ResultSets(Mapping):
+    """
+    Read only mapping of result set name to DataFrame for a single response.
+    Only result sets with rows are present, and each one is only turned into a DataFrame the first time it is
+    accessed, so callers that use one result set don't pay for the others.
+    """
+
+    def __init__(self, sets, source=None, content=None, on_decode=None):
+        self.source = source
+        # Called with the seconds spent building each frame
+        self.on_decode = on_decode
+        # The raw response body, kept so the response can be shared and decoded again
+        self.content = content
+        self._sets = {}
+        self._frames = {}
+        for s in sets:
+            if s['rowSet']:
+                # Validate eagerly so malformed responses fail inside Smart's retry loop
+                if not isinstance(s['headers'], list):
+                    raise ValueError('Result set {} has no headers'.format(s['name']))
+                self._sets[s['name']] = s
+
+    def __getitem__(self, name):
+        if name not in self._frames:
+            result_set = self._sets[name]
+            start = time.monotonic()
+            try:
+                self._frames[name] = build_frame(result_set)
+            except Exception:
+                print(self.source)
+                print(result_set['name'], result_set['headers'])
+                raise Exception("Failed to deserialize the response!")
+            # The frame owns the data now, let the parsed rows be freed
+            result_set['rowSet'] = None
+            if self.on_decode is not None:
+                self.on_decode(time.monotonic() - start)
+        return self._frames[name]
+
+    def __iter__(self):
+        return iter(self._sets)
+
+    def __len__(self):
+        return len(self._sets)
+
+    def __repr__(self):
+        return 'ResultSets({})'.format(list(self._sets))
@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+
+from api.cache import ResponseCache
+
+
+class FixtureRecorder:
+    """
+    Writes every successful API response to `fixtures_dir/<endpoint>/<key>.json`, where key is the same hash of the
+    normalized params used by the response cache. Each fixture holds the endpoint, the params and the response body,
+    and is what the stand in stats server serves.
+    """
+
+    def __init__(self, fixtures_dir):
+        self.fixtures_dir = fixtures_dir
+        self.recorded = 0
+        self._lock = threading.Lock()
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def path(self, endpoint, params):
+        return fixture_path(self.fixtures_dir, endpoint, ResponseCache.key(endpoint, params))
+
+    def record(self, endpoint, params, content):
+        path = self.path(endpoint, params)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fixture = {
+            'endpoint': endpoint,
+            'params': [list(p) for p in ResponseCache.normalize_params(params)],
+            'body': json.loads(content),
+        }
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(fixture, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.recorded += 1
+
+
+def fixture_path(fixtures_dir, endpoint, key):
+    return os.path.join(fixtures_dir, endpoint, key + '.json')
+
+
+def load_fixtures(fixtures_dir):
+    """
+    Returns {endpoint: {key: raw response body bytes}} for every fixture in fixtures_dir.
+    """
+    fixtures = {}
+    for endpoint in sorted(os.listdir(fixtures_dir)):
+        endpoint_dir = os.path.join(fixtures_dir, endpoint)
+        if not os.path.isdir(endpoint_dir):
+            continue
+        for name in sorted(os.listdir(endpoint_dir)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(endpoint_dir, name)) as f:
+                fixture = json.load(f)
+            fixtures.setdefault(endpoint, {})[name[:-len('.json')]] = json.dumps(fixture['body']).encode('utf-8')
+    return fixtures
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+DEFAULT_HEDGE_BUDGET = 0.05
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_MIN_SAMPLES = 20
+SUCCESS = 200
+
+
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies per endpoint.
+    """
+
+    def __init__(self, window=500, min_samples=DEFAULT_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self._latencies[endpoint].append(seconds)
+
+    def percentile(self, endpoint, q):
+        """
+        Returns the q-th percentile latency for the endpoint, or None until min_samples latencies are recorded.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies[endpoint])
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(len(latencies) - 1, int(round(q / 100.0 * (len(latencies) - 1))))
+        return latencies[index]
+
+
+class HedgeBudget:
+    """
+    Allows at most `ratio` hedged requests per request sent, so hedging can only add a few percent of load.
+    """
+
+    def __init__(self, ratio=DEFAULT_HEDGE_BUDGET):
+        self.ratio = ratio
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self):
+        with self._lock:
+            if self.hedges + 1 > self.requests * self.ratio:
+                return False
+            self.hedges += 1
+            return True
+
+
+class Hedger:
+    """
+    Sends a second identical request when the first has not completed within the endpoint's observed p95
+    latency of successful responses, and returns whichever succeeds first. The losing request is left to finish in
+    the background.
+    """
+
+    def __init__(self, budget=DEFAULT_HEDGE_BUDGET, percentile=DEFAULT_HEDGE_PERCENTILE, min_samples=DEFAULT_MIN_SAMPLES,
+                 max_workers=32):
+        self.percentile = percentile
+        self.latencies = LatencyTracker(min_samples=min_samples)
+        self.budget = HedgeBudget(budget)
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='smart-hedge')
+
+    def _timed(self, endpoint, fn, before=None):
+        if before is not None:
+            # Time spent waiting to send (e.g. for the rate limiter) is not the endpoint's latency
+            before()
+        start = time.monotonic()
+        result = fn()
+        # Only successful responses count, an error page or throttle answered quickly would lower the percentile
+        if result.status_code == SUCCESS:
+            self.latencies.record(endpoint, time.monotonic() - start)
+        return result
+
+    def run(self, endpoint, send, before_hedge=None):
+        """
+        Calls send() and returns its response, hedging with a second send() if it is slow. before_hedge() is called
+        before sending the hedge and is not timed.
+
+        Once hedged, the first successful response wins. A failed one (an exception or a non-200 status) is only
+        returned, or raised, when the other request has failed too.
+        """
+        self.budget.record_request()
+        delay = self.latencies.percentile(endpoint, self.percentile)
+        if delay is None:
+            return self._timed(endpoint, send)
+
+        primary = self._executor.submit(self._timed, endpoint, send)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.try_spend():
+            return primary.result()
+
+        hedge = self._executor.submit(self._timed, endpoint, send, before_hedge)
+        pending = {primary, hedge}
+        failed = None
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if error is None:
+                        error = future.exception()
+                elif future.result().status_code == SUCCESS:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return future.result()
+                elif failed is None:
+                    failed = future.result()
+        # A response (e.g. a 429 with its Retry-After) tells the caller more than an exception
+        if failed is not None:
+            return failed
+        raise error
+
+    def stats(self):
+        return {
+            'requests': self.budget.requests,
+            'hedges': self.budget.hedges,
+            'hedges_won': self.hedges_won,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
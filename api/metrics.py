@@ -0,0 +1,201 @@
+import json
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# Failure classes recorded per endpoint
+THROTTLED = 'throttled'
+TIMEOUT = 'timeout'
+CONNECTION = 'connection'
+HTTP_ERROR = 'http_error'
+DECODE_ERROR = 'decode_error'
+OTHER = 'other'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.successes = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.hedges = 0
+        self.failures = defaultdict(int)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        self.decode = Histogram(LATENCY_BUCKETS)
+        self.frame_decode = Histogram(LATENCY_BUCKETS)
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'retries': self.retries,
+            'cache_hits': self.cache_hits,
+            'coalesced': self.coalesced,
+            'hedges': self.hedges,
+            'failures': dict(self.failures),
+            'latency_seconds': self.latency.to_dict(),
+            'response_bytes': self.response_bytes.to_dict(),
+            'decode_seconds': self.decode.to_dict(),
+            'frame_decode_seconds': self.frame_decode.to_dict(),
+        }
+
+
+class SmartMetrics:
+    """
+    Per endpoint request metrics recorded by Smart: calls, HTTP attempts, retries, failure classes, cache hits,
+    coalesced calls and histograms of latency, response size, response parse time and the time each result set
+    took to decode into a DataFrame.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointMetrics)
+
+    def _update(self, endpoint, fn):
+        with self._lock:
+            fn(self._endpoints[endpoint])
+
+    def record_call(self, endpoint):
+        self._update(endpoint, lambda m: setattr(m, 'calls', m.calls + 1))
+
+    def record_cache_hit(self, endpoint):
+        self._update(endpoint, lambda m: setattr(m, 'cache_hits', m.cache_hits + 1))
+
+    def record_coalesced(self, endpoint):
+        self._update(endpoint, lambda m: setattr(m, 'coalesced', m.coalesced + 1))
+
+    def record_hedge(self, endpoint):
+        self._update(endpoint, lambda m: setattr(m, 'hedges', m.hedges + 1))
+
+    def record_retry(self, endpoint):
+        self._update(endpoint, lambda m: setattr(m, 'retries', m.retries + 1))
+
+    def record_attempt(self, endpoint, seconds, response_bytes=None, failure=None):
+        def update(m):
+            m.attempts += 1
+            m.latency.observe(seconds)
+            if response_bytes is not None:
+                m.response_bytes.observe(response_bytes)
+            if failure is None:
+                m.successes += 1
+            else:
+                m.failures[failure] += 1
+        self._update(endpoint, update)
+
+    def record_decode(self, endpoint, seconds):
+        self._update(endpoint, lambda m: m.decode.observe(seconds))
+
+    def record_frame_decode(self, endpoint, seconds):
+        self._update(endpoint, lambda m: m.frame_decode.observe(seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: m.to_dict() for endpoint, m in sorted(self._endpoints.items())}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        counters = [
+            ('calls', 'Endpoint method calls'),
+            ('attempts', 'HTTP requests sent'),
+            ('successes', 'HTTP requests that returned a usable response'),
+            ('retries', 'Retried HTTP requests'),
+            ('cache_hits', 'Calls served from the response cache'),
+            ('coalesced', 'Calls that shared an identical in-flight request'),
+            ('hedges', 'Hedged requests sent'),
+        ]
+        for name, description in counters:
+            lines.append('# HELP smart_{}_total {}'.format(name, description))
+            lines.append('# TYPE smart_{}_total counter'.format(name))
+            for endpoint, m in snapshot.items():
+                lines.append('smart_{}_total{{endpoint="{}"}} {}'.format(name, endpoint, m[name]))
+
+        lines.append('# HELP smart_failures_total Failed HTTP requests by failure class')
+        lines.append('# TYPE smart_failures_total counter')
+        for endpoint, m in snapshot.items():
+            for failure, count in sorted(m['failures'].items()):
+                lines.append('smart_failures_total{{endpoint="{}",class="{}"}} {}'.format(endpoint, failure, count))
+
+        histograms = [
+            ('latency_seconds', 'HTTP request latency'),
+            ('response_bytes', 'HTTP response body size'),
+            ('decode_seconds', 'Time spent parsing response JSON'),
+            ('frame_decode_seconds', 'Time spent decoding each result set into a DataFrame'),
+        ]
+        for name, description in histograms:
+            lines.append('# HELP smart_{} {}'.format(name, description))
+            lines.append('# TYPE smart_{} histogram'.format(name))
+            for endpoint, m in snapshot.items():
+                histogram = m[name]
+                for bound, count in histogram['buckets'].items():
+                    lines.append('smart_{}_bucket{{endpoint="{}",le="{}"}} {}'.format(name, endpoint, bound, count))
+                lines.append('smart_{}_bucket{{endpoint="{}",le="+Inf"}} {}'.format(name, endpoint, histogram['count']))
+                lines.append('smart_{}_sum{{endpoint="{}"}} {}'.format(name, endpoint, histogram['sum']))
+                lines.append('smart_{}_count{{endpoint="{}"}} {}'.format(name, endpoint, histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        Writes the metrics to path, as JSON if the path ends in .json and as Prometheus text otherwise.
+        """
+        content = self.to_json() if path.endswith('.json') else self.to_prometheus()
+        with open(path, 'w') as f:
+            f.write(content)
+        print(f"Wrote API metrics to {path}")
+
+    def summary(self):
+        """
+        Returns a one line per endpoint summary, slowest endpoints (by total latency) first.
+        """
+        snapshot = self.snapshot()
+        rows = sorted(snapshot.items(), key=lambda item: item[1]['latency_seconds']['sum'], reverse=True)
+        lines = []
+        for endpoint, m in rows:
+            latency = m['latency_seconds']
+            mean = latency['sum'] / latency['count'] if latency['count'] else 0.0
+            lines.append('{}: {} calls, {} requests, {} retries, {} cache hits, {:.1f}s total, {:.3f}s mean, '
+                         '{:.1f}MB, failures {}'.format(endpoint, m['calls'], m['attempts'], m['retries'],
+                                                        m['cache_hits'], latency['sum'], mean,
+                                                        m['response_bytes']['sum'] / 1e6, m['failures']))
+        return '\n'.join(lines)
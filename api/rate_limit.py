@@ -0,0 +1,257 @@
+import json
+import os
+import random
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+DEFAULT_RATE = 8.0
+DEFAULT_MIN_RATE = 0.5
+DEFAULT_MAX_RATE = 20.0
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. acquire() blocks until a token is available.
+    `rate` tokens are added per second, up to `capacity` tokens.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self, tokens=1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose rate adapts to the upstream. The rate is multiplied by `decrease_factor` when a throttling
+    response is seen (at most once per `cooldown` seconds, so a burst of in-flight failures only counts once) and
+    increased by `increase_step` requests/second after every `ramp_up_after` consecutive successes.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE, decrease_factor=0.5,
+                 increase_step=0.5, ramp_up_after=20, cooldown=5.0):
+        if not min_rate <= rate <= max_rate:
+            raise ValueError("Rate must be between min_rate and max_rate")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.ramp_up_after = ramp_up_after
+        self.cooldown = cooldown
+        self.bucket = TokenBucket(rate, capacity=1.0)
+        self.successes = 0
+        self.throttles = 0
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self):
+        self.bucket.acquire()
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            if self.successes >= self.ramp_up_after and self.rate < self.max_rate:
+                self.successes = 0
+                self.bucket.set_rate(min(self.max_rate, self.rate + self.increase_step))
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.successes = 0
+            now = time.monotonic()
+            if now - self.last_decrease < self.cooldown:
+                return
+            self.last_decrease = now
+            new_rate = max(self.min_rate, self.rate * self.decrease_factor)
+            print(f"Throttled by upstream, reducing request rate to {new_rate:.2f}/s")
+            self.bucket.set_rate(new_rate)
+
+
+class SharedRateLimiter:
+    """
+    Adaptive token bucket shared by every process on the host that points at the same state file.
+    The bucket, the current rate and the set of active processes live in a small JSON file guarded by flock, so
+    the aggregate request rate of all processes stays under one budget. Each process gets an equal share: it may
+    only take a token every (active processes / rate) seconds, where a process is active if it requested a token
+    in the last `stale_after` seconds. Throttling seen by any process lowers the rate for all of them.
+
+    The rate is kept in the file between runs. An explicit `rate` replaces it on this process's first use of the
+    file, unless other processes are still using it; with rate None the kept rate is used (DEFAULT_RATE for a new
+    file).
+    """
+
+    def __init__(self, path, rate=None, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 decrease_factor=0.5, increase_step=0.5, ramp_up_after=20, cooldown=5.0, stale_after=5.0):
+        if fcntl is None:
+            raise RuntimeError("SharedRateLimiter requires fcntl file locking, which is not available on this platform")
+        self.rate_given = rate is not None
+        if rate is None:
+            rate = DEFAULT_RATE
+        if not min_rate <= rate <= max_rate:
+            raise ValueError("Rate must be between min_rate and max_rate")
+        self.path = path
+        self.initial_rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+        self.ramp_up_after = ramp_up_after
+        self.cooldown = cooldown
+        self.stale_after = stale_after
+        self.throttles = 0
+        self._seeded = False
+        # Serializes threads of this process; flock serializes processes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _update(self, fn):
+        """
+        Runs fn(state, now) with the state file locked, writes the state back and returns fn's result.
+        """
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except ValueError:
+                    state = {}
+                now = time.time()
+                state.setdefault('rate', self.initial_rate)
+                state.setdefault('tokens', 1.0)
+                state.setdefault('updated', now)
+                state.setdefault('successes', 0)
+                state.setdefault('last_decrease', 0.0)
+                state.setdefault('processes', {})
+                if not self._seeded:
+                    self._seed(state, now)
+                result = fn(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _seed(self, state, now):
+        # A rate kept from an earlier run (possibly throttled down to min_rate) must not override an explicit rate,
+        # but a rate other running processes are adapting is left alone
+        self._seeded = True
+        pid = str(os.getpid())
+        live = any(p != pid and now - last < self.stale_after for p, last in state['processes'].items())
+        if self.rate_given and not live:
+            state['rate'] = self.initial_rate
+            state['successes'] = 0
+
+    @property
+    def rate(self):
+        return self._update(lambda state, now: state['rate'])
+
+    def _try_acquire(self, state, now):
+        # Refill the shared bucket, never holding more than one token so processes can't burst together
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(1.0, state['tokens'] + elapsed * state['rate'])
+        state['updated'] = now
+
+        pid = str(os.getpid())
+        processes = {p: last for p, last in state['processes'].items() if now - last < self.stale_after}
+        last_acquire = processes.get(pid)
+        processes.setdefault(pid, 0.0)
+        state['processes'] = processes
+
+        wait = 0.0
+        if state['tokens'] < 1.0:
+            wait = (1.0 - state['tokens']) / state['rate']
+        share_interval = len(processes) / state['rate']
+        if last_acquire is not None and now - last_acquire < share_interval:
+            wait = max(wait, share_interval - (now - last_acquire))
+        if wait > 0:
+            # Keep this process registered as active while it waits
+            if last_acquire is None:
+                processes[pid] = now - share_interval
+            return wait
+        state['tokens'] -= 1.0
+        processes[pid] = now
+        return 0.0
+
+    def acquire(self):
+        while True:
+            wait = self._update(self._try_acquire)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def on_success(self):
+        def success(state, now):
+            state['successes'] += 1
+            if state['successes'] >= self.ramp_up_after and state['rate'] < self.max_rate:
+                state['successes'] = 0
+                state['rate'] = min(self.max_rate, state['rate'] + self.increase_step)
+        self._update(success)
+
+    def on_throttle(self):
+        def throttle(state, now):
+            state['successes'] = 0
+            if now - state['last_decrease'] < self.cooldown:
+                return None
+            state['last_decrease'] = now
+            state['rate'] = max(self.min_rate, state['rate'] * self.decrease_factor)
+            return state['rate']
+        self.throttles += 1
+        new_rate = self._update(throttle)
+        if new_rate is not None:
+            print(f"Throttled by upstream, reducing shared request rate to {new_rate:.2f}/s")
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: the delay for attempt n is uniform in [0, min(cap, base * 2**n)].
+    """
+
+    def __init__(self, base=0.5, cap=30.0):
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(self.cap, retry_after))
+        return delay
+
+    def sleep(self, attempt, retry_after=None):
+        time.sleep(self.delay(attempt, retry_after))
@@ -0,0 +1,67 @@
+import threading
+
+# Matches the largest default ThreadPoolExecutor so every worker thread can hold its own connection.
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_POOL_CONNECTIONS = 4
+
+
+class PooledSession:
+    """
+    A keep-alive requests.Session shared by every Smart call.
+    pool_connections is the number of hosts with a cached connection pool, pool_maxsize the number of connections
+    kept open per host. With pool_block set, a thread waits for a free connection instead of opening one past the
+    per host limit. max_retries only covers failures to connect. Read timeouts and errors, like status codes, are
+    left to Smart, which backs off, slows its rate limiter and records them in its metrics.
+    The underlying urllib3 pools are thread safe, so one instance can be shared across a thread pool.
+    """
+
+    def __init__(self, headers=None, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 max_retries=2, pool_block=True):
+        # requests is only loaded once a session is built, see utils.lazy
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.pool_block = pool_block
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        if headers is not None:
+            self.session.headers.update(headers)
+        retry = Retry(total=max_retries, connect=max_retries, read=0, status=0, backoff_factor=0.1,
+                      raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry,
+                                   pool_block=pool_block)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        """
+        Returns request and connection counts across all host pools. Every request that did not need a new
+        connection reused a kept-alive one.
+        """
+        requests_sent = 0
+        connections_opened = 0
+        with self._lock:
+            pools = self.adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+        reused = max(requests_sent - connections_opened, 0)
+        return {
+            'requests': requests_sent,
+            'connections_opened': connections_opened,
+            'connections_reused': reused,
+            'reuse_rate': reused / requests_sent if requests_sent else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
@@ -1,11 +1,24 @@
+import atexit
 import datetime
+import time
 
 import pandas as pd
-import requests
-import sys
 
-pd.set_option('display.max_columns', 500)
-pd.set_option('display.width', 1000)
+from api.decode import ResultSets, loads
+from api.cache import ResponseCache, DEFAULT_MAX_BYTES
+from api.rate_limit import (
+    AdaptiveRateLimiter,
+    SharedRateLimiter,
+    Backoff,
+    DEFAULT_MIN_RATE,
+    DEFAULT_MAX_RATE,
+)
+from api.single_flight import SingleFlight
+from api.hedging import Hedger, DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_PERCENTILE
+from api.metrics import SmartMetrics, THROTTLED, TIMEOUT, CONNECTION, HTTP_ERROR, DECODE_ERROR, OTHER
+from api.fixtures import FixtureRecorder
+from api.session import PooledSession, DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE
+from utils.lazy import Lazy
 
 
 class NBATeams:
@@ -83,6 +96,8 @@ class PtMeasureType:
     PaintTouches = 'PaintTouch'
 
 
+THROTTLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
 headers = {
     'Host': 'stats.nba.com',
     'Connection': 'keep-alive',
@@ -114,6 +129,14 @@ class Smart:
         self.default_season_type = 'Regular Season'
 
         self.base_url = 'https://stats.nba.com/stats/'
+        self.cache = None
+        self.session = PooledSession(self.headers)
+        self.rate_limiter = AdaptiveRateLimiter()
+        self.backoff = Backoff()
+        self.single_flight = SingleFlight()
+        self.hedger = None
+        self.metrics = SmartMetrics()
+        self.recorder = None
 
     def __current_season(self):
         now = datetime.datetime.now()
@@ -545,42 +568,207 @@ class Smart:
         response = self.api_call('shotchartdetail', params=params)
         return response['Shot_Chart_Detail']
 
+    def after_fork(self):
+        """
+        Called in a forked child: gives it its own HTTP connections, in-flight call table and hedging threads, keeping
+        the cache, rate limiter and endpoint configuration.
+        """
+        session = self.session
+        self.session = PooledSession(self.headers, pool_connections=session.pool_connections,
+                                     pool_maxsize=session.pool_maxsize, max_retries=session.max_retries,
+                                     pool_block=session.pool_block)
+        self.single_flight = SingleFlight()
+        if self.hedger is not None:
+            # The parent's hedging threads do not exist in the child, build a new pool instead of closing that one
+            hedger, self.hedger = self.hedger, None
+            self.configure_hedging(budget=hedger.budget.ratio, percentile=hedger.percentile)
+
+    def configure_session(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                          max_retries=2, pool_block=True):
+        """
+        Replaces the pooled HTTP session shared by all endpoint methods.
+        """
+        self.session.close()
+        self.session = PooledSession(self.headers, pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                     max_retries=max_retries, pool_block=pool_block)
+
+    def configure_rate_limit(self, rate=None, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE, shared_path=None):
+        """
+        Replaces the rate limiter. `rate` is the starting requests/second, adapted between min_rate and max_rate.
+        With shared_path the budget is shared with every other process using the same state file.
+        Does nothing if neither a rate nor a shared_path is provided.
+        """
+        if rate is None and shared_path is None:
+            return
+        if shared_path is not None:
+            # Without a rate, the rate kept in the state file is used
+            self.rate_limiter = SharedRateLimiter(shared_path, rate=rate, min_rate=min_rate,
+                                                  max_rate=max_rate if rate is None else max(rate, max_rate))
+            return
+        self.rate_limiter = AdaptiveRateLimiter(rate=rate, min_rate=min_rate, max_rate=max(rate, max_rate))
+
+    def configure_hedging(self, enabled=True, budget=DEFAULT_HEDGE_BUDGET, percentile=DEFAULT_HEDGE_PERCENTILE):
+        """
+        Enables hedged requests: a request still running after the endpoint's observed `percentile` latency is
+        sent a second time and the first response wins. `budget` caps hedges as a fraction of all requests.
+        """
+        if self.hedger is not None:
+            self.hedger.close()
+            self.hedger = None
+        if enabled:
+            self.hedger = Hedger(budget=budget, percentile=percentile, max_workers=self.session.pool_maxsize)
+
+    def configure_metrics(self, metrics_path=None):
+        """
+        Writes the API metrics to metrics_path (JSON if it ends in .json, Prometheus text otherwise) when the
+        process exits. Does nothing if no metrics_path is provided.
+        """
+        if metrics_path is None:
+            return
+        atexit.register(self.__dump_metrics, metrics_path)
+
+    def __dump_metrics(self, metrics_path):
+        summary = self.metrics.summary()
+        if summary:
+            print(summary)
+        connections = self.session.stats()
+        if connections['requests']:
+            print('{requests} HTTP requests, {connections_opened} connections opened, {connections_reused} reused '
+                  '({reuse_rate:.0%})'.format(**connections))
+        self.metrics.dump(metrics_path)
+
+    def configure_stand_in(self, api_url=None, record_fixtures=None):
+        """
+        Points Smart at another stats server (e.g. api.stand_in_server) and/or records every response fetched from
+        the network as a fixture in the record_fixtures directory. Does nothing for arguments that are None.
+        """
+        if api_url is not None:
+            self.base_url = api_url if api_url.endswith('/') else api_url + '/'
+        if record_fixtures is not None:
+            self.recorder = FixtureRecorder(record_fixtures)
+
+    def configure_cache(self, cache_dir=None, cache_only=False, max_bytes=DEFAULT_MAX_BYTES, ttls=None):
+        """
+        Enables the on disk response cache. Does nothing if no cache_dir is provided.
+        """
+        if cache_dir is None:
+            if cache_only:
+                raise ValueError("Must provide a cache directory to run in cache only mode")
+            return
+        self.cache = ResponseCache(cache_dir, current_season=self.default_season, max_bytes=max_bytes, ttls=ttls,
+                                   cache_only=cache_only)
+
     def api_call(self, endpoint, params, headers=None, timeout=10, retries=10):
+        self.metrics.record_call(endpoint)
+        # Identical requests already in flight on another thread share that request's response
+        key = (endpoint, ResponseCache.normalize_params(params))
+        results, shared = self.single_flight.do(key, lambda: self.__fetch(endpoint, params, headers, timeout, retries))
+        if shared:
+            self.metrics.record_coalesced(endpoint)
+            # Callers modify the returned frames, so every waiter decodes its own copy
+            return self.parse_response(endpoint, results.content)
+        return results
+
+    def __fetch(self, endpoint, params, headers, timeout, retries):
+        if self.cache is not None:
+            content = self.cache.get(endpoint, params)
+            if content is not None:
+                self.metrics.record_cache_hit(endpoint)
+                return self.parse_response(endpoint, content)
         return self.api_call_with_retry(endpoint, params, headers, timeout, retries)
 
     def api_call_with_retry(self, endpoint, params, headers=None, timeout=10, retries_left=10):
-        # print('Calling: "{}{} - {}" -- retries remaining: {}'.format(self.base_url, endpoint, params, retries_left))
-        if retries_left > 0:
+        # Imported here, with the session, so importing Smart does not load requests
+        import requests
+
+        if headers is None:
+            headers = self.headers
+        url = "{}{}".format(self.base_url, endpoint)
+
+        def send():
+            return self.session.get(url, params=params, headers=headers, timeout=timeout)
+
+        def before_hedge():
+            # Hedged requests are paced like any other request
+            self.rate_limiter.acquire()
+            self.metrics.record_hedge(endpoint)
+
+        attempt = 0
+        while retries_left > 0:
+            retries_left -= 1
+            retry_after = None
+            if attempt > 0:
+                self.metrics.record_retry(endpoint)
+            self.rate_limiter.acquire()
+            start = time.monotonic()
             try:
-                if headers is None:
-                    headers = self.headers
-                resp = requests.get("{}{}".format(self.base_url, endpoint), params=params, headers=headers,
-                                    timeout=timeout)
-                if resp.status_code != 200:
+                # print('Calling: "{}{} - {}" -- retries remaining: {}'.format(self.base_url, endpoint, params, retries_left))
+                if self.hedger is not None:
+                    resp = self.hedger.run(endpoint, send, before_hedge=before_hedge)
+                else:
+                    resp = send()
+                latency = time.monotonic() - start
+                if resp.status_code in THROTTLE_STATUS_CODES:
+                    self.metrics.record_attempt(endpoint, latency, len(resp.content), failure=THROTTLED)
+                    print('{} throttled with status code {}: {}'.format(endpoint, resp.status_code, resp.request.path_url))
+                    self.rate_limiter.on_throttle()
+                    retry_after = self.__retry_after(resp)
+                elif resp.status_code != 200:
+                    self.metrics.record_attempt(endpoint, latency, len(resp.content), failure=HTTP_ERROR)
                     print('Non-200 status code:')
                     print(resp.status_code)
                     print(resp.request.path_url)
                     print(resp.content)
-                    raise ValueError('{} returned with the status code: {}'.format(endpoint, resp.status_code))
-
-                sets = resp.json()['resultSets']
-                results = {}
-                for s in sets:
+                else:
                     try:
-                        if s['rowSet']:
-                            frame = pd.DataFrame(s['rowSet'])
-                            frame.columns = s['headers']
-                            results[s['name']] = frame
-                    except:
-                        print(resp.request.path_url)
-                        print(s)
-                        raise Exception("Failed to deserialize the response!")
-                return results
-            except:
-                print("Unexpected error:", sys.exc_info()[0])
-                return self.api_call_with_retry(endpoint, params, headers, retries_left - 1)
-        else:
-            raise Exception('Number of retries exceeded')
-
-
-smart = Smart()
+                        results = self.parse_response(endpoint, resp.content, source=resp.request.path_url)
+                    except Exception as e:
+                        self.metrics.record_attempt(endpoint, latency, len(resp.content), failure=DECODE_ERROR)
+                        print("Failed to decode {} response: {}".format(endpoint, e))
+                    else:
+                        self.metrics.record_attempt(endpoint, latency, len(resp.content))
+                        self.rate_limiter.on_success()
+                        if self.cache is not None:
+                            self.cache.put(endpoint, params, resp.content)
+                        if self.recorder is not None:
+                            self.recorder.record(endpoint, params, resp.content)
+                        return results
+            except requests.Timeout as e:
+                self.metrics.record_attempt(endpoint, time.monotonic() - start, failure=TIMEOUT)
+                print('{} timed out: {}'.format(endpoint, e))
+                self.rate_limiter.on_throttle()
+            except requests.ConnectionError as e:
+                self.metrics.record_attempt(endpoint, time.monotonic() - start, failure=CONNECTION)
+                print('{} lost its connection: {}'.format(endpoint, e))
+                self.rate_limiter.on_throttle()
+            except Exception as e:
+                self.metrics.record_attempt(endpoint, time.monotonic() - start, failure=OTHER)
+                print("Unexpected error:", e)
+            if retries_left > 0:
+                self.backoff.sleep(attempt, retry_after)
+            attempt += 1
+        raise Exception('Number of retries exceeded')
+
+    @staticmethod
+    def __retry_after(resp):
+        try:
+            return float(resp.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+    def parse_response(self, endpoint, content, source=None):
+        start = time.monotonic()
+        results = ResultSets(loads(content)['resultSets'], source=source or endpoint, content=content,
+                             on_decode=lambda seconds: self.metrics.record_frame_decode(endpoint, seconds))
+        self.metrics.record_decode(endpoint, time.monotonic() - start)
+        return results
+
+
+def create_smart():
+    pd.set_option('display.max_columns', 500)
+    pd.set_option('display.width', 1000)
+    return Smart()
+
+
+# Built on first use, so importing an ETL does not open an HTTP session
+smart = Lazy(create_smart, after_fork=Smart.after_fork)
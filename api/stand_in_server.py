@@ -0,0 +1,147 @@
+"""
+Local stand in for stats.nba.com that serves recorded fixtures, for running the ETLs and load testing Smart offline.
+
+Record fixtures by running any ETL against the real API with --record_fixtures DIR, then serve them with:
+    ./.venv/bin/python -m api.stand_in_server --fixtures DIR --port 8765 --latency_ms 150 --throttle_rate 0.05
+and point an ETL at it with --api_url http://127.0.0.1:8765/stats/
+"""
+import argparse
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+from api.cache import ResponseCache
+from api.fixtures import load_fixtures
+
+
+class StandInConfig:
+    def __init__(self, fixtures, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=None,
+                 strict=False, seed=None):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.misses = 0
+
+    def draw(self):
+        """
+        Returns (delay seconds, outcome) for the next request, outcome being 'throttle', 'error' or 'ok'.
+        """
+        with self.lock:
+            self.requests += 1
+            delay = self.latency_ms
+            if self.jitter_ms:
+                delay = max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms))
+            delay /= 1000.0
+            roll = self.random.random()
+            if roll < self.throttle_rate:
+                self.throttled += 1
+                return delay, 'throttle'
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return delay, 'error'
+            return delay, 'ok'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this keep-alive requests stall on delayed ACKs
+    disable_nagle_algorithm = True
+    config = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        params = parse_qsl(url.query, keep_blank_values=True)
+
+        delay, outcome = self.config.draw()
+        if delay:
+            time.sleep(delay)
+        if outcome == 'throttle':
+            headers = {'Retry-After': str(self.config.retry_after)} if self.config.retry_after is not None else {}
+            return self.respond(429, b'Too Many Requests', headers)
+        if outcome == 'error':
+            return self.respond(500, b'Internal Server Error')
+
+        endpoint_fixtures = self.config.fixtures.get(endpoint)
+        if not endpoint_fixtures:
+            return self.respond(404, 'No fixtures recorded for {}'.format(endpoint).encode('utf-8'))
+        body = endpoint_fixtures.get(ResponseCache.key(endpoint, params))
+        if body is None:
+            with self.config.lock:
+                self.config.misses += 1
+            if self.config.strict:
+                return self.respond(404, 'No fixture recorded for {}?{}'.format(endpoint, url.query).encode('utf-8'))
+            # Serve a deterministic fixture for this endpoint so load tests can use any params
+            keys = sorted(endpoint_fixtures)
+            body = endpoint_fixtures[keys[zlib.crc32(url.query.encode('utf-8')) % len(keys)]]
+        self.respond(200, body, {'Content-Type': 'application/json'})
+
+    def respond(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(config, host='127.0.0.1', port=8765):
+    handler = type('ConfiguredStandInHandler', (StandInHandler,), {'config': config})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve recorded stats.nba.com fixtures locally.')
+    parser.add_argument('--fixtures', action='store', dest='fixtures', required=True,
+                        help='Directory of fixtures recorded with --record_fixtures')
+    parser.add_argument('--host', action='store', dest='host', default='127.0.0.1')
+    parser.add_argument('--port', action='store', dest='port', type=int, default=8765)
+    parser.add_argument('--latency_ms', action='store', dest='latency_ms', type=float, default=0.0,
+                        help='Mean latency added to every response')
+    parser.add_argument('--jitter_ms', action='store', dest='jitter_ms', type=float, default=0.0,
+                        help='Standard deviation of the added latency')
+    parser.add_argument('--error_rate', action='store', dest='error_rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 500')
+    parser.add_argument('--throttle_rate', action='store', dest='throttle_rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 429')
+    parser.add_argument('--retry_after', action='store', dest='retry_after', type=int,
+                        help='Retry-After seconds sent with 429 responses')
+    parser.add_argument('--strict', action='store_true', dest='strict',
+                        help='Answer 404 when no fixture matches the exact params instead of serving another fixture')
+    parser.add_argument('--seed', action='store', dest='seed', type=int, help='Seed for reproducible latencies and errors')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    print('Loaded fixtures: {}'.format(', '.join('{} ({})'.format(e, len(f)) for e, f in fixtures.items())))
+    config = StandInConfig(fixtures, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                           throttle_rate=args.throttle_rate, retry_after=args.retry_after, strict=args.strict,
+                           seed=args.seed)
+    server = create_server(config, args.host, args.port)
+    print('Serving on http://{}:{}/stats/'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print('Served {} requests: {} throttled, {} errors, {} without an exact fixture'.format(
+            config.requests, config.throttled, config.errors, config.misses))
+
+
+if __name__ == '__main__':
+    main()
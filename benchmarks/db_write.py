@@ -0,0 +1,102 @@
+"""
+Compares rows/second of PostgresClient.write upserting a play by play sized DataFrame, and the resulting index size:
+- through a multi-row INSERT ... ON CONFLICT statement (insert) or COPY into a staging table (copy)
+- keyed on the old string id built row by row with '-'.join (id) or on the composite (GAME_ID, EVENTNUM) key
+Needs a database configured in database/creds.py; the benchmark creates (and drops) its own scratch tables.
+
+Usage:
+    ./.venv/bin/python -m benchmarks.db_write
+    ./.venv/bin/python -m benchmarks.db_write --rows 100000 --on_conflict ignore --key composite
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Text, text
+
+from database.db_client import database_client
+from database.db_constants import Columns
+from database.db_schemas import PLAY_BY_PLAY_COLUMNS, TableSchema
+from database.migrate_primary_keys import index_size
+
+
+def synthetic_play_by_play(rows):
+    rng = random.Random(0)
+    events_per_game = 500
+    return pd.DataFrame({
+        'GAME_ID': ['00224{:05d}'.format(i // events_per_game) for i in range(rows)],
+        'EVENTNUM': [i % events_per_game for i in range(rows)],
+        'EVENTMSGTYPE': [rng.randint(1, 13) for _ in range(rows)],
+        'EVENTMSGACTIONTYPE': [rng.randint(0, 110) for _ in range(rows)],
+        'PERIOD': [1 + (i % events_per_game) // 125 for i in range(rows)],
+        'PCTIMESTRING': ['{}:{:02d}'.format(rng.randint(0, 11), rng.randint(0, 59)) for _ in range(rows)],
+        'HOMEDESCRIPTION': [rng.choice(['Jump Shot', 'REBOUND', None]) for _ in range(rows)],
+        'PLAYER1_ID': [1630000 + rng.randint(0, 500) for _ in range(rows)],
+        'PLAYER2_ID': [rng.choice([1630000 + rng.randint(0, 500), np.nan]) for _ in range(rows)],
+        'SCOREMARGIN': [rng.choice(['TIE', '5', '-3', '']) for _ in range(rows)],
+        'SEASON': '2024-25',
+        'SEASON_TYPE': 'Regular Season',
+    })
+
+
+def scratch_schema(table_name, key):
+    if key == 'id':
+        return TableSchema(table_name, {Columns.ID: Text(), **PLAY_BY_PLAY_COLUMNS}, primary_key=(Columns.ID,))
+    return TableSchema(table_name, PLAY_BY_PLAY_COLUMNS, primary_key=(Columns.GAME_ID, Columns.EVENTNUM))
+
+
+def timed_write(df, schema, key, method, on_conflict):
+    start = time.perf_counter()
+    df = schema.cast(df)
+    if key == 'id':
+        # The string id the ETLs used to build with utils.add_id
+        df = df.set_index(df[[Columns.GAME_ID, Columns.EVENTNUM]].astype(str).agg('-'.join, axis=1))
+    database_client.write(df, schema.name, on_conflict=on_conflict, method=method, index=key == 'id')
+    return time.perf_counter() - start
+
+
+def drop_table(table_name):
+    with database_client.engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS {table_name};'))
+    database_client.invalidate_schema(table_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PostgresClient.write upserts.')
+    parser.add_argument('--rows', action='store', dest='rows', type=int, default=50000)
+    parser.add_argument('--on_conflict', action='store', dest='on_conflict', default='replace',
+                        choices=['replace', 'ignore'])
+    parser.add_argument('--method', action='store', dest='method', choices=['insert', 'copy'],
+                        help='Only benchmark this write method')
+    parser.add_argument('--key', action='store', dest='key', choices=['id', 'composite'],
+                        help='Only benchmark this primary key')
+    parser.add_argument('--table', action='store', dest='table', default='benchmark_db_write')
+    args = parser.parse_args()
+
+    df = synthetic_play_by_play(args.rows)
+    methods = [args.method] if args.method else ['insert', 'copy']
+    keys = [args.key] if args.key else ['id', 'composite']
+    try:
+        for key in keys:
+            schema = scratch_schema(f'{args.table}_{key}', key)
+            drop_table(schema.name)
+            database_client.create_table(schema)
+            for method in methods:
+                with database_client.engine.begin() as conn:
+                    conn.execute(text(f'TRUNCATE {schema.name};'))
+                # First pass inserts new rows, second pass hits the ON CONFLICT path for every row
+                for phase in ['insert new', 'upsert existing']:
+                    seconds = timed_write(df, schema, key, method, args.on_conflict)
+                    print(f"{key:>9} key {method:>6} {phase:>15}: {seconds:.2f}s, {args.rows / seconds:,.0f} rows/s")
+            with database_client.engine.connect() as conn:
+                print(f"{key:>9} key indexes: {index_size(conn, schema.name) / 1e6:.1f}MB for {args.rows} rows")
+    finally:
+        for key in keys:
+            drop_table(f'{args.table}_{key}')
+        database_client.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compares CPU time and peak memory of decoding a stats.nba.com response the old way (json + row oriented DataFrame
+for every result set) against api.decode (orjson if installed + lazy column-wise DataFrames).
+
+Usage:
+    ./.venv/bin/python -m benchmarks.decode_result_sets
+    ./.venv/bin/python -m benchmarks.decode_result_sets --file response.json --result_set Shot_Chart_Detail
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from api.decode import ResultSets, loads
+
+SHOT_CHART_HEADERS = [
+    'GRID_TYPE', 'GAME_ID', 'GAME_EVENT_ID', 'PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'TEAM_NAME', 'PERIOD',
+    'MINUTES_REMAINING', 'SECONDS_REMAINING', 'EVENT_TYPE', 'ACTION_TYPE', 'SHOT_TYPE', 'SHOT_ZONE_BASIC',
+    'SHOT_ZONE_AREA', 'SHOT_ZONE_RANGE', 'SHOT_DISTANCE', 'LOC_X', 'LOC_Y', 'SHOT_ATTEMPTED_FLAG', 'SHOT_MADE_FLAG',
+    'GAME_DATE', 'HTM', 'VTM',
+]
+
+
+def synthetic_shot_chart(rows):
+    rng = random.Random(0)
+    row_set = []
+    for i in range(rows):
+        row_set.append([
+            'Shot Chart Detail', '00224{:05d}'.format(i // 200), i % 700, 1630000 + i % 500, 'Player Name',
+            1610612737 + i % 30, 'Team Name', 1 + i % 4, rng.randint(0, 11), rng.randint(0, 59),
+            rng.choice(['Made Shot', 'Missed Shot']), 'Jump Shot', '2PT Field Goal', 'Mid-Range', 'Center(C)',
+            '8-16 ft.', rng.randint(0, 30), rng.randint(-250, 250), rng.randint(-50, 400), 1, rng.randint(0, 1),
+            '20241022', 'BOS', 'NYK',
+        ])
+    league_averages = [['League Averages', 'Above the Break 3', 'Back Court(BC)', 'Back Court Shot', 100, 2, 0.02]] * 20
+    return json.dumps({'resultSets': [
+        {'name': 'Shot_Chart_Detail', 'headers': SHOT_CHART_HEADERS, 'rowSet': row_set},
+        {'name': 'LeagueAverages', 'headers': ['GRID_TYPE', 'SHOT_ZONE_BASIC', 'SHOT_ZONE_AREA', 'SHOT_ZONE_RANGE',
+                                               'FGA', 'FGM', 'FG_PCT'], 'rowSet': league_averages},
+    ]}).encode('utf-8')
+
+
+def decode_row_oriented(content, result_set):
+    sets = json.loads(content)['resultSets']
+    results = {}
+    for s in sets:
+        if s['rowSet']:
+            frame = pd.DataFrame(s['rowSet'])
+            frame.columns = s['headers']
+            results[s['name']] = frame
+    return results[result_set]
+
+
+def decode_lazy(content, result_set):
+    return ResultSets(loads(content)['resultSets'])[result_set]
+
+
+def measure(fn, content, result_set, repeat):
+    cpu = []
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(content, result_set)
+        cpu.append(time.process_time() - start)
+    tracemalloc.start()
+    fn(content, result_set)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(cpu), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark decoding of stats.nba.com responses.')
+    parser.add_argument('--file', action='store', dest='file',
+                        help='Raw (or gzip compressed) response to decode instead of a synthetic shot chart')
+    parser.add_argument('--result_set', action='store', dest='result_set', default='Shot_Chart_Detail')
+    parser.add_argument('--rows', action='store', dest='rows', type=int, default=200000)
+    parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        opener = gzip.open if args.file.endswith('.gz') else open
+        with opener(args.file, 'rb') as f:
+            content = f.read()
+    else:
+        content = synthetic_shot_chart(args.rows)
+
+    expected = decode_row_oriented(content, args.result_set)
+    actual = decode_lazy(content, args.result_set)
+    pd.testing.assert_frame_equal(expected, actual)
+
+    print(f"Response size: {len(content) / 1e6:.1f}MB, {len(expected)} rows in {args.result_set}")
+    for name, fn in [('row oriented', decode_row_oriented), ('lazy columnar', decode_lazy)]:
+        cpu, peak = measure(fn, content, args.result_set, args.repeat)
+        print(f"{name:>14}: {cpu:.3f}s CPU, {peak / 1e6:.1f}MB peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares converting PERIOD and PCTIMESTRING to seconds from the start of the game for a season of play by play rows,
+row by row with DataFrame.apply (how the ETLs used to do it) against utils.clock.seconds_from_start on whole columns.
+
+Usage:
+    ./.venv/bin/python -m benchmarks.game_clock
+    ./.venv/bin/python -m benchmarks.game_clock --games 100 --repeat 5
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from utils.clock import REGULATION_PERIODS, seconds_from_start
+
+
+def row_by_row(period, time_str):
+    # The per row conversion the ETLs applied before utils.clock
+    minutes, seconds = map(int, time_str.split(':'))
+    if int(period) <= 4:
+        return (int(period) - 1) * 12 * 60 + (12 * 60 - (minutes * 60 + seconds))
+    else:
+        return 4 * 12 * 60 + (int(period) - 5) * 5 * 60 + (5 * 60 - (minutes * 60 + seconds))
+
+
+def synthetic_season(games, events_per_game=480):
+    """
+    Play by play PERIOD and PCTIMESTRING columns for `games` games, one in ten going to overtime.
+    """
+    rng = random.Random(0)
+    periods = []
+    clocks = []
+    for game in range(games):
+        game_periods = REGULATION_PERIODS + (1 if game % 10 == 0 else 0)
+        for event in range(events_per_game):
+            period = 1 + event * game_periods // events_per_game
+            length = 12 * 60 if period <= REGULATION_PERIODS else 5 * 60
+            left = rng.randint(0, length)
+            periods.append(period)
+            clocks.append(f'{left // 60}:{left % 60:02d}')
+    return pd.DataFrame({'PERIOD': pd.array(periods, dtype='Int16'), 'PCTIMESTRING': clocks})
+
+
+def best_of(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark game clock conversion.')
+    parser.add_argument('--games', action='store', dest='games', type=int, default=1230,
+                        help='Number of games, 1230 is a regular season')
+    parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_season(args.games)
+    apply_seconds, expected = best_of(
+        lambda: df.apply(lambda row: row_by_row(row['PERIOD'], row['PCTIMESTRING']), axis=1), args.repeat)
+    vector_seconds, actual = best_of(lambda: seconds_from_start(df['PERIOD'], df['PCTIMESTRING']), args.repeat)
+    pd.testing.assert_series_equal(expected.astype('int64'), actual.astype('int64'))
+
+    print(f"{len(df)} rows from {args.games} games")
+    print(f"  DataFrame.apply: {apply_seconds:.3f}s, {len(df) / apply_seconds:,.0f} rows/s")
+    print(f"      utils.clock: {vector_seconds:.3f}s, {len(df) / vector_seconds:,.0f} rows/s "
+          f"({apply_seconds / vector_seconds:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
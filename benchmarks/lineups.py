@@ -0,0 +1,145 @@
+"""
+Compares assigning the ten players on court to every play by play event of a season, walking every event and
+scanning the rotations at each period start (how play_by_play_with_players used to do it) against
+utils.lineups.assign_lineups, and checks both give the same lineups. Games are synthetic: random substitutions and
+period starters, with rotations stints that match them.
+
+Usage:
+    ./.venv/bin/python -m benchmarks.lineups
+    ./.venv/bin/python -m benchmarks.lineups --games 100 --repeat 3
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from database.db_constants import Columns
+from utils.clock import REGULATION_PERIODS, TENTHS_PER_SECOND, period_length, period_start, seconds_from_start
+from utils.lineups import SUBSTITUTION, START_OF_PERIOD, TeamStints, assign_lineups
+
+TEAMS = (1610612737, 1610612738)
+
+
+def row_by_row(pbp, team_rots, teams):
+    # The per event loop play_by_play_with_players ran before utils.lineups
+    def initial_players(team_rot):
+        starters = team_rot[team_rot[Columns.STINTS].apply(lambda stints: any(s['IN_TIME_REAL'] == 0 for s in stints))]
+        return sorted(starters[Columns.PLAYER_ID].tolist())
+
+    def sub(team_players, row):
+        out_id = getattr(row, Columns.PLAYER1_ID)
+        team_players[team_players.index(out_id)] = getattr(row, Columns.PLAYER2_ID)
+        team_players.sort()
+        return team_players
+
+    def stint_change(team_players, team_rot, tenths):
+        stints = team_rot[Columns.STINTS]
+        out_players = team_rot[stints.apply(lambda s: any(x['OUT_TIME_REAL'] == tenths for x in s))]
+        in_players = team_rot[stints.apply(lambda s: any(x['IN_TIME_REAL'] == tenths for x in s))]
+        for pid in out_players[Columns.PLAYER_ID].tolist():
+            if pid in team_players:
+                team_players.remove(pid)
+        for pid in in_players[Columns.PLAYER_ID].tolist():
+            if pid not in team_players:
+                team_players.append(pid)
+        team_players.sort()
+        return team_players
+
+    current = [initial_players(team_rots[0]), initial_players(team_rots[1])]
+    rows = []
+    for row in pbp.itertuples(index=False):
+        if getattr(row, Columns.EVENTMSGTYPE) == SUBSTITUTION:
+            team = teams.index(getattr(row, Columns.PLAYER1_TEAM_ID))
+            current[team] = sub(current[team], row)
+        if getattr(row, Columns.EVENTMSGTYPE) == START_OF_PERIOD:
+            tenths = getattr(row, Columns.SECONDS_FROM_START) * TENTHS_PER_SECOND
+            current = [stint_change(current[i], team_rots[i], tenths) for i in range(2)]
+        rows.append(current[0][:5] + current[1][:5])
+    return np.array(rows, dtype=object).reshape(len(rows), 10)
+
+
+def synthetic_game(rng, game, events_per_period=120, subs_per_period=8):
+    """
+    One game's play by play (sorted like play_by_play_with_players sorts it) and each team's rotations.
+    """
+    periods = REGULATION_PERIODS + (1 if game % 10 == 0 else 0)
+    rosters = [[team * 100 + player for player in range(12)] for team in TEAMS]
+    stints = [{player: [] for player in roster} for roster in rosters]
+    events = []
+    for period in range(1, periods + 1):
+        start = int(period_start(period))
+        length = int(period_length(period))
+        events.append((period, length, START_OF_PERIOD, None, None, None))
+        on_court = [sorted(rng.sample(roster, 5)) for roster in rosters]
+        entered = [{player: start for player in players} for players in on_court]
+        for left in sorted(rng.sample(range(1, length), subs_per_period), reverse=True):
+            team = rng.randrange(2)
+            out_id = rng.choice(on_court[team])
+            in_id = rng.choice([p for p in rosters[team] if p not in on_court[team]])
+            now = start + length - left
+            stints[team][out_id].append({'IN_TIME_REAL': entered[team].pop(out_id) * TENTHS_PER_SECOND,
+                                         'OUT_TIME_REAL': now * TENTHS_PER_SECOND})
+            entered[team][in_id] = now
+            on_court[team][on_court[team].index(out_id)] = in_id
+            events.append((period, left, SUBSTITUTION, out_id, in_id, TEAMS[team]))
+        for team in range(2):
+            for player, since in entered[team].items():
+                stints[team][player].append({'IN_TIME_REAL': since * TENTHS_PER_SECOND,
+                                             'OUT_TIME_REAL': (start + length) * TENTHS_PER_SECOND})
+        for _ in range(events_per_period):
+            events.append((period, rng.randint(0, length - 1), 1, None, None, None))
+
+    pbp = pd.DataFrame(events, columns=[Columns.PERIOD, 'LEFT', Columns.EVENTMSGTYPE, Columns.PLAYER1_ID,
+                                        Columns.PLAYER2_ID, Columns.PLAYER1_TEAM_ID])
+    pbp[Columns.PCTIMESTRING] = [f'{left // 60}:{left % 60:02d}' for left in pbp['LEFT']]
+    pbp[Columns.EVENTNUM] = np.arange(len(pbp))
+    pbp[Columns.SECONDS_FROM_START] = seconds_from_start(pbp[Columns.PERIOD], pbp[Columns.PCTIMESTRING])
+    pbp = pbp.sort_values([Columns.PERIOD, Columns.SECONDS_FROM_START, Columns.EVENTNUM]).reset_index(drop=True)
+    team_rots = [pd.DataFrame({Columns.PLAYER_ID: list(team_stints), Columns.STINTS: list(team_stints.values())})
+                 for team_stints in stints]
+    return pbp, team_rots
+
+
+def best_of(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark lineup assignment.')
+    parser.add_argument('--games', action='store', dest='games', type=int, default=1230,
+                        help='Number of games, 1230 is a regular season')
+    parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    games = [synthetic_game(rng, game) for game in range(args.games)]
+    rows = sum(len(pbp) for pbp, _ in games)
+
+    def engine():
+        # Building the stints arrays is part of the cost, as in process_game
+        return [assign_lineups(pbp, TEAMS[0], TEAMS[1], TeamStints(rots[0]), TeamStints(rots[1]),
+                               lambda team_id, period: None) for pbp, rots in games]
+
+    loop_seconds, expected = best_of(lambda: [row_by_row(pbp, rots, TEAMS) for pbp, rots in games], args.repeat)
+    engine_seconds, actual = best_of(engine, args.repeat)
+    for game, (want, got) in enumerate(zip(expected, actual)):
+        if not np.array_equal(want, got):
+            raise Exception(f"Lineups differ for game {game}")
+
+    print(f"{rows} events from {args.games} games")
+    print(f"  per event loop: {loop_seconds:.3f}s, {rows / loop_seconds:,.0f} events/s")
+    print(f"   utils.lineups: {engine_seconds:.3f}s, {rows / engine_seconds:,.0f} events/s "
+          f"({loop_seconds / engine_seconds:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures the wall time of `python -m etl.<stage> --help` for every ETL stage, and fails if the median of any stage is
+over the startup budget. --help exits right after argument parsing, so this is the cost of importing the stage: the
+database client and the stats API client are built on first use (utils.lazy), not on import.
+With --imports, also prints the slowest top level imports of each stage from python -X importtime.
+
+Usage:
+    ./.venv/bin/python -m benchmarks.startup
+    ./.venv/bin/python -m benchmarks.startup --stage rotations --repeat 10 --imports
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = [
+    'team_game_log',
+    'rotations',
+    'play_by_play',
+    'players_on_court_at_start_of_period',
+    'play_by_play_with_players',
+    'shot_details',
+    'pipeline',
+]
+
+# Seconds. Most of it is importing pandas and SQLAlchemy, which every stage uses.
+DEFAULT_BUDGET = 1.5
+
+
+def time_help(stage):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', f'etl.{stage}', '--help'], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise Exception(f"etl.{stage} --help failed:\n{result.stderr}")
+    return seconds
+
+
+def top_imports(stage, n):
+    """
+    Returns the n top level imports with the largest cumulative import time, as (microseconds, module).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', f'etl.{stage}', '--help'],
+                            capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Top level imports are the ones not indented under another import
+        if not module.startswith('  '):
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ETL startup time.')
+    parser.add_argument('--stage', action='store', dest='stage', choices=STAGES, help='Only benchmark this stage')
+    parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=5)
+    parser.add_argument('--budget', action='store', dest='budget', type=float, default=DEFAULT_BUDGET,
+                        help='Maximum median seconds for a stage')
+    parser.add_argument('--imports', action='store_true', dest='imports',
+                        help='Print the slowest top level imports of each stage')
+    args = parser.parse_args()
+
+    stages = [args.stage] if args.stage else STAGES
+    over_budget = []
+    for stage in stages:
+        # The first run warms the bytecode and file system caches
+        time_help(stage)
+        median = statistics.median(time_help(stage) for _ in range(args.repeat))
+        status = 'ok' if median <= args.budget else 'OVER BUDGET'
+        print(f"{stage:>36}: {median:.3f}s median of {args.repeat} ({status})")
+        if median > args.budget:
+            over_budget.append(stage)
+        if args.imports:
+            for microseconds, module in top_imports(stage, 5):
+                print(f"{'':>38}{microseconds / 1e6:.3f}s {module}")
+    if over_budget:
+        raise Exception(f"Startup over the {args.budget}s budget: {', '.join(over_budget)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,27 @@
+import io
+import threading
+
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import ProgrammingError, OperationalError
 import pandas as pd
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy import MetaData, Table
 from database.db_constants import Columns
+from database.db_schemas import get_schema
+from utils.lazy import Lazy
+
+DEFAULT_CHUNK_SIZE = 50000
 
-from database.creds import creds
+# pandas dtypes for PostgreSQL type OIDs, nullable so a chunk with NULLs keeps the same dtype as one without
+PG_TYPE_DTYPES = {
+    16: 'boolean',     # bool
+    20: 'Int64',       # int8
+    21: 'Int16',       # int2
+    23: 'Int32',       # int4
+    700: 'float32',    # float4
+    701: 'float64',    # float8
+    1700: 'float64',   # numeric
+}
 
 
 class PostgresClient:
@@ -17,12 +33,78 @@ class PostgresClient:
         self.host = host
         self.port = port
         self.engine = self._create_engine()
+        # Schema metadata cache: reflected Table objects by table name. Only tables known to exist are cached.
+        self._tables = {}
+        # Names of partitions known to exist
+        self._partitions = set()
+        self._schema_lock = threading.Lock()
+
+    @classmethod
+    def from_creds(cls):
+        """
+        Returns a client for the database configured in database/creds.py.
+        """
+        from database.creds import creds
+        return cls(dbname=creds.dbname, user=creds.user, password=creds.password, host=creds.host, port=creds.port)
+
+    def after_fork(self):
+        """
+        Called in a forked child: drops the pooled connections inherited from the parent without closing them, so the
+        child opens its own and the parent's stay usable.
+        """
+        self.engine.dispose(close=False)
+        self._schema_lock = threading.Lock()
 
     def _create_engine(self):
         return create_engine(
             f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.dbname}"
         )
 
+    def reflect_table(self, table_name, conn=None):
+        """
+        Returns the reflected SQLAlchemy Table, reflecting it at most once per client until invalidated.
+        Returns None if the table does not exist.
+        """
+        with self._schema_lock:
+            table = self._tables.get(table_name)
+        if table is not None:
+            return table
+        if conn is None:
+            with self.engine.connect() as conn:
+                return self.reflect_table(table_name, conn)
+        if not self.engine.dialect.has_table(conn, table_name):
+            return None
+        table = Table(table_name, MetaData(), autoload_with=conn)
+        with self._schema_lock:
+            self._tables[table_name] = table
+        return table
+
+    def table_exists(self, table_name, conn=None):
+        return self.reflect_table(table_name, conn) is not None
+
+    def table_columns(self, table_name, conn=None):
+        table = self.reflect_table(table_name, conn)
+        return [] if table is None else [col.name for col in table.columns]
+
+    def primary_key(self, table_name, conn=None):
+        """
+        Returns the primary key column names of the table, falling back to ['id'] for tables without one.
+        """
+        table = self.reflect_table(table_name, conn)
+        columns = [] if table is None else [col.name for col in table.primary_key.columns]
+        return columns or [Columns.ID]
+
+    def invalidate_schema(self, table_name=None):
+        """
+        Drops cached metadata for table_name, or for every table if None. Call after altering a table outside write().
+        """
+        with self._schema_lock:
+            if table_name is None:
+                self._tables.clear()
+                self._partitions.clear()
+            else:
+                self._tables.pop(table_name, None)
+                self._partitions = {p for p in self._partitions if not p.startswith(table_name + '_')}
 
     def read(self, query, params=None):
         """
@@ -34,21 +116,63 @@ class PostgresClient:
             print(f"Database error: {e}")
             return None
 
-    def write(self, df, table_name, if_exists='append', index=True, on_conflict='replace'):
+    def read_chunks(self, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Execute a SELECT query through a server-side cursor and yield the result as DataFrames of at most chunk_size
+        rows, so a season of play-by-play can be processed without holding it all in memory.
+        Column dtypes come from the column types of the result rather than each chunk's values, so every chunk has
+        the same dtypes: integers are nullable Int16/Int32/Int64, floats float32/float64 and everything else object.
+        """
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+            result = conn.execute(text(query), params or {})
+            columns = list(result.keys())
+            dtypes = {
+                name: PG_TYPE_DTYPES[column.type_code]
+                for name, column in zip(columns, result.cursor.description)
+                if column.type_code in PG_TYPE_DTYPES
+            }
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=columns).astype(dtypes)
+
+    def write(self, df, table_name, if_exists='append', index=None, on_conflict='replace', method='copy',
+              after_write=None):
         """
-        Write a pandas DataFrame to a table. Handles id collision based on 'on_conflict' parameter.
+        Write a pandas DataFrame to a table. Handles primary key collision based on 'on_conflict' parameter.
         if_exists: {'fail', 'replace', 'append'}
-        on_conflict: None, 'replace', or 'ignore'. If set, will use PostgreSQL ON CONFLICT clause for id collision.
+        on_conflict: None, 'replace', or 'ignore'. If set, will use PostgreSQL ON CONFLICT clause on the primary key.
+        index: write the DataFrame index as the 'id' column. Defaults to False for tables with a schema in db_schemas,
+        which are keyed on their own columns, and True otherwise.
+        method: 'copy' to bulk load through COPY and a staging table, or 'insert' for a multi-row INSERT statement.
+        Tables with a schema in db_schemas are created with the declared column types and frames are cast to them.
+        after_write: called with (conn, df) once the rows are written, in the same transaction for upserts, e.g. to
+        record them in the ingestion manifest.
         """
-        # Check if table exists
-        if not self.engine.dialect.has_table(self.engine.connect(), table_name):
+        schema = get_schema(table_name)
+        if index is None:
+            index = schema is None
+        if schema is not None:
+            df = schema.cast(df)
+            if not self.table_exists(table_name):
+                self.create_table(schema, df)
+            elif tuple(self.primary_key(table_name)) != schema.primary_key:
+                migration = 'migrate_partitions' if schema.partition_by else 'migrate_primary_keys'
+                raise Exception(f"Table '{table_name}' is keyed on {self.primary_key(table_name)}, expected "
+                                f"{list(schema.primary_key)}. Run database.{migration} first.")
+            self.ensure_partitions(schema, df)
+
+        if not self.table_exists(table_name):
             # Table does not exist, create it
 
             # Always use lowercase 'id' for index_label and primary key
             df.to_sql(table_name, self.engine, if_exists='fail', index=index, index_label='id')
+            self.invalidate_schema(table_name)
             self.set_table_columns_not_null(table_name)
             self.set_primary_key_id(table_name)
             self.add_standard_indexes(table_name, df)
+            self._after_write(after_write, df)
 
             print(f"Table '{table_name}' did not exist and was created from DataFrame.")
             return
@@ -57,6 +181,8 @@ class PostgresClient:
             # Use default pandas to_sql behavior
             try:
                 df.to_sql(table_name, self.engine, if_exists=if_exists, index=index)
+                self.invalidate_schema(table_name)
+                self._after_write(after_write, df)
                 # Add indexes for GAME_ID, SEASON, SEASON_TYPE if present
                 print(f"Table '{table_name}' written from DataFrame.")
             except ValueError as e:
@@ -66,38 +192,143 @@ class PostgresClient:
                     raise
             except (ProgrammingError, OperationalError) as e:
                 print(f"Database error: {e}")
+        elif method == 'copy':
+            with self.engine.begin() as conn:
+                self.copy_upsert(df, table_name, on_conflict=on_conflict, conn=conn, index=index)
+                if after_write is not None:
+                    after_write(conn, df)
+            print(f"Table '{table_name}' written from DataFrame with COPY and on_conflict='{on_conflict}'.")
         else:
-            # Use ON CONFLICT for id collision handling (only works with if_exists='append')
+            # Use ON CONFLICT for primary key collision handling (only works with if_exists='append')
             # This requires manual insert using SQLAlchemy Table object
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=self.engine)
-            records = []
-            for idx, row in df.iterrows():
-                data = row.to_dict()
-                data['id'] = idx  # Ensure the index is included as 'id'
-                records.append(data)
+            table = self.reflect_table(table_name)
+            key = self.primary_key(table_name)
+            frame = self._with_index(df, index)
+            records = frame.to_dict('records')
 
             with self.engine.begin() as conn:
                 stmt = insert(table)
                 if on_conflict == 'replace':
                     stmt = stmt.on_conflict_do_update(
-                        index_elements=['id'],
-                        set_={k: stmt.excluded[k] for k in df.columns}
+                        index_elements=key,
+                        set_={k: stmt.excluded[k] for k in frame.columns if k not in key}
                     )
                 elif on_conflict == 'ignore':
-                    stmt = stmt.on_conflict_do_nothing(index_elements=['id'])
+                    stmt = stmt.on_conflict_do_nothing(index_elements=key)
 
                 conn.execute(stmt, records)
+                if after_write is not None:
+                    after_write(conn, df)
             # Add indexes for GAME_ID, SEASON, SEASON_TYPE if present
             print(f"Table '{table_name}' written from DataFrame with on_conflict='{on_conflict}'.")
-            
+
+    def _after_write(self, after_write, df):
+        # to_sql commits on its own, so the hook runs in a transaction of its own
+        if after_write is not None:
+            with self.engine.begin() as conn:
+                after_write(conn, df)
+
+    def create_table(self, schema, df=None):
+        """
+        Creates the table declared by a db_schemas.TableSchema, including any extra columns df has, with its primary
+        key, NOT NULL constraints and the standard indexes.
+        """
+        table = schema.table(df)
+        with self.engine.begin() as conn:
+            table.create(conn, checkfirst=True)
+        self.invalidate_schema(schema.name)
+        self.add_standard_indexes(schema.name, df if df is not None else pd.DataFrame(columns=list(schema.columns)))
+        print(f"Table '{schema.name}' created from its declared schema.")
+
+    def ensure_partitions(self, schema, df):
+        """
+        Creates any partitions of a partitioned schema table that the rows of df need and do not exist yet.
+        """
+        if not schema.partition_by:
+            return
+        rows = df[list(schema.partition_by)].drop_duplicates().itertuples(index=False, name=None)
+        for row in rows:
+            for depth in range(1, len(row) + 1):
+                name = schema.partition_name(row[:depth])
+                with self._schema_lock:
+                    if name in self._partitions:
+                        continue
+                with self.engine.begin() as conn:
+                    conn.execute(text(schema.partition_ddl(row[:depth])))
+                with self._schema_lock:
+                    self._partitions.add(name)
+                print(f"Partition '{name}' of '{schema.name}' ready.")
+
+    def copy_upsert(self, df, table_name, on_conflict='replace', conn=None, index=True):
+        """
+        Streams df (with its index as 'id' if index is True) into a temporary staging table with COPY and merges it
+        into table_name with a single INSERT ... SELECT ... ON CONFLICT on the primary key, either replacing or
+        ignoring existing rows. Runs in conn's transaction if given, otherwise in its own.
+        """
+        if conn is None:
+            with self.engine.begin() as conn:
+                return self.copy_upsert(df, table_name, on_conflict=on_conflict, conn=conn, index=index)
+
+        key = self.primary_key(table_name, conn)
+        frame = self._copy_frame(self._with_index(df, index))
+        columns = list(frame.columns)
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        key_list = ', '.join(f'"{c}"' for c in key)
+        if on_conflict == 'replace':
+            conflict = 'DO UPDATE SET ' + ', '.join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in key)
+        elif on_conflict == 'ignore':
+            conflict = 'DO NOTHING'
+        else:
+            raise ValueError(f"Unsupported on_conflict for COPY upsert: {on_conflict}")
+        staging = f"{table_name}_staging"
+
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False, na_rep='\\N')
+        buffer.seek(0)
+
+        # COPY is only available on the DBAPI cursor, which shares conn's transaction
+        with conn.connection.cursor() as cur:
+            cur.execute(f'CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP;')
+            cur.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N');", buffer)
+            cur.execute(
+                f'INSERT INTO {table_name} ({column_list}) SELECT {column_list} FROM {staging} '
+                f'ON CONFLICT ({key_list}) {conflict};'
+            )
+
+    @staticmethod
+    def _with_index(df, index):
+        """
+        Returns df with its index as a leading 'id' column if index is True, otherwise df unchanged.
+        """
+        return df.rename_axis(Columns.ID).reset_index() if index else df
+
+    @staticmethod
+    def _copy_frame(df):
+        """
+        Returns df with float columns that only hold whole numbers (ints upcast by NaNs) converted to nullable ints,
+        so COPY sends "2" rather than "2.0", which integer columns would reject.
+        """
+        converted = {}
+        for col in df.columns:
+            values = df[col]
+            if pd.api.types.is_float_dtype(values):
+                non_null = values.dropna()
+                if len(non_null) and (non_null % 1 == 0).all():
+                    converted[col] = values.astype('Int64')
+        return df.assign(**converted) if converted else df
+
     def add_standard_indexes(self, table_name, df):
         """
         Add indexes for GAME_ID, SEASON, SEASON_TYPE columns if present in the DataFrame or table.
         Ensures these columns are always indexed, even if not present in the current DataFrame.
         Uses column names from db_constants.Columns.
+        Tables with a schema in db_schemas get the indexes declared there instead.
         """
-        
+        schema = get_schema(table_name)
+        if schema is not None:
+            self.create_indexes(schema)
+            return
+
         # Use constants for column names
         index_col_names = [Columns.GAME_ID, Columns.SEASON, Columns.SEASON_TYPE]
         index_cols = set()
@@ -106,11 +337,12 @@ class PostgresClient:
                 index_cols.add(col)
         # Also check table columns in case df doesn't have all columns (e.g., partial writes)
         try:
-            metadata = MetaData()
-            table = Table(table_name, metadata, autoload_with=self.engine)
+            columns = self.table_columns(table_name)
             for col in index_col_names:
-                if col in table.columns:
+                if col in columns:
                     index_cols.add(col)
+            # The primary key index already serves lookups on its leading column
+            index_cols.discard(self.primary_key(table_name)[0])
         except Exception as e:
             print(f"Could not reflect table {table_name} for index creation: {e}")
         with self.engine.begin() as conn:
@@ -122,6 +354,19 @@ class PostgresClient:
                 except Exception as e:
                     print(f"Could not create index for {col} on {table_name}: {e}")
 
+    def create_indexes(self, schema):
+        """
+        Creates the indexes declared in the table's schema that do not exist yet. On a partitioned table each index
+        is created on every partition, including ones added later.
+        """
+        for index in schema.indexes:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text(index.ddl(schema.name)))
+                print(f"Index {index.name(schema.name)} created on {schema.name}.")
+            except Exception as e:
+                print(f"Could not create index {index.name(schema.name)} on {schema.name}: {e}")
+
     def set_primary_key_id(self, table_name):
         """
         Alters the given table to set the 'id' column as the primary key.
@@ -130,6 +375,7 @@ class PostgresClient:
         alter_sql = f"ALTER TABLE {table_name} ADD PRIMARY KEY (id);"
         with self.engine.begin() as conn:
             conn.execute(text(alter_sql))
+        self.invalidate_schema(table_name)
         print(f"Primary key set to 'id' for table '{table_name}'.")
 
     def set_table_columns_not_null(self, table_name):
@@ -138,25 +384,18 @@ class PostgresClient:
         Skips columns that cannot be set to NOT NULL due to existing NULL values.
         Each column is altered in its own transaction to avoid aborting the whole block.
         """
-        # Reflect table columns
-        metadata = MetaData()
-        table = Table(table_name, metadata, autoload_with=self.engine)
-        for col in table.columns:
-            alter_sql = f"ALTER TABLE {table_name} ALTER COLUMN {col.name} SET NOT NULL;"
+        for col in self.table_columns(table_name):
+            alter_sql = f"ALTER TABLE {table_name} ALTER COLUMN {col} SET NOT NULL;"
             try:
                 with self.engine.begin() as conn:
                     conn.execute(text(alter_sql))
             except Exception as e:
-                print(f"Could not set NOT NULL on column {col.name}: {e}")
+                print(f"Could not set NOT NULL on column {col}: {e}")
+        self.invalidate_schema(table_name)
     
     def close(self):
         self.engine.dispose()
 
     
-database_client = PostgresClient(
-        dbname=creds.dbname,
-        user=creds.user,
-        password=creds.password,
-        host=creds.host,
-        port=creds.port
-    )
\ No newline at end of file
+# Built on first use, so importing an ETL does not create an engine or read the credentials
+database_client = Lazy(PostgresClient.from_creds, after_fork=PostgresClient.after_fork)
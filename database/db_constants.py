@@ -1,19 +1,25 @@
 # Table and column name constants
 
 class Tables:
+    INGESTION_MANIFEST = "ingestion_manifest"
     PLAY_BY_PLAY = "play_by_play"
+    PLAY_BY_PLAY_WITH_PLAYERS = "play_by_play_with_players"
     PLAYERS_ON_COURT_AT_START_OF_PERIOD = "players_on_court_at_start_of_period"
     ROTATIONS = "rotations"
+    SHOT_DETAILS = "shot_details"
     TEAM_GAME_LOG = "team_game_log"
 
 
 class Columns:
+    CONTENT_HASH = "CONTENT_HASH"
+    ERROR = "ERROR"
     EVENTMSGTYPE = "EVENTMSGTYPE"
     EVENTMSGACTIONTYPE = "EVENTMSGACTIONTYPE"
     EVENTNUM = 'EVENTNUM'
     GAME_ID = "GAME_ID"
     ID = "id"
     IN_TIME_REAL = "IN_TIME_REAL"
+    ITEM_ID = "ITEM_ID"
     OUT_TIME_REAL = "OUT_TIME_REAL"
     PCTIMESTRING = "PCTIMESTRING"
     PERIOD = "PERIOD"
@@ -27,12 +33,17 @@ class Columns:
     PLAYER_ID = "PLAYER_ID"
     PLAYER_LAST_NAME = "PLAYER_LAST"
     PLAYER_NAME = "PLAYER_NAME"
+    ROW_COUNT = "ROW_COUNT"
     SEASON = "SEASON"
     SEASON_TYPE = "SEASON_TYPE"
     SECONDS_FROM_START = "SECONDS_FROM_START"
+    STAGE = "STAGE"
+    STARTED_AT = "STARTED_AT"
+    STATUS = "STATUS"
     STINTS = "STINTS"
     TEAM1_PLAYER = "TEAM1_PLAYER"
     TEAM2_PLAYER = "TEAM2_PLAYER"
     TEAM_ID = "TEAM_ID"
     TEAM_NAME = "TEAM_NAME"
+    UPDATED_AT = "UPDATED_AT"
     # Add more column names as needed
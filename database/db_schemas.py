@@ -0,0 +1,319 @@
+# Explicit column types for the tables written by the ETLs
+
+import re
+
+import pandas as pd
+from sqlalchemy import (
+    BigInteger, Boolean, CHAR, Column, DateTime, Float, Integer, MetaData, PrimaryKeyConstraint, REAL, SmallInteger,
+    String, Table, Text,
+)
+
+from database.db_constants import Tables, Columns
+
+GAME_ID_TYPE = CHAR(10)
+SEASON_TYPE_TYPE = String(20)
+SEASON_COLUMN_TYPE = CHAR(7)
+
+# Nullable pandas dtypes used to cast frames before writing
+PANDAS_DTYPES = {
+    SmallInteger: 'Int16',
+    Integer: 'Int32',
+    BigInteger: 'Int64',
+    REAL: 'float32',
+    Float: 'float64',
+}
+
+
+class Index:
+    """
+    A secondary index declared for a table. include lists columns stored in a btree index's leaf pages so queries that
+    only read them are answered by an index only scan. using='brin' builds a block range index, a few pages in size,
+    for columns whose values follow the order rows are inserted in.
+    """
+
+    def __init__(self, columns, include=(), using='btree'):
+        self.columns = tuple(columns)
+        self.include = tuple(include)
+        self.using = using
+        if include and using != 'btree':
+            raise ValueError("INCLUDE columns are only supported on btree indexes")
+
+    def name(self, table_name):
+        suffix = '_'.join(c.lower() for c in self.columns)
+        return f'idx_{table_name}_{suffix}' + ('' if self.using == 'btree' else f'_{self.using}')
+
+    def ddl(self, table_name):
+        column_list = ', '.join(f'"{c}"' for c in self.columns)
+        ddl = f'CREATE INDEX IF NOT EXISTS {self.name(table_name)} ON {table_name} USING {self.using} ({column_list})'
+        if self.include:
+            ddl += ' INCLUDE (' + ', '.join(f'"{c}"' for c in self.include) + ')'
+        return ddl + ';'
+
+
+class TableSchema:
+    """
+    Declared column types for a table. Columns a frame has that are not declared are created with the type pandas
+    would infer, so new API fields still land in the table.
+    partition_by lists the columns the table is LIST partitioned on, one partitioning level per column (e.g. SEASON,
+    then SEASON_TYPE). PostgreSQL requires them to be part of the primary key.
+    indexes lists the table's secondary indexes; the primary key's index is not repeated there.
+    """
+
+    def __init__(self, name, columns, primary_key, not_null=(), partition_by=(), indexes=()):
+        self.name = name
+        self.columns = dict(columns)
+        self.primary_key = tuple(primary_key)
+        self.not_null = set(primary_key) | set(not_null)
+        self.partition_by = tuple(partition_by)
+        self.indexes = tuple(indexes)
+        missing = [c for c in self.partition_by if c not in self.primary_key]
+        if missing:
+            raise ValueError(f"Partition columns {missing} of {name} must be part of its primary key")
+
+    def table(self, df=None, metadata=None, extra_columns=None):
+        """
+        Returns a SQLAlchemy Table with the declared columns, followed by any extra columns df has and any
+        extra_columns ({name: type}). Partitioned schemas return the partitioned parent table.
+        """
+        types = dict(self.columns)
+        if df is not None:
+            types.update((c, infer_column_type(df[c])) for c in df.columns if c not in types)
+        for name, column_type in (extra_columns or {}).items():
+            types.setdefault(name, column_type)
+        columns = [
+            Column(name, column_type, autoincrement=False, nullable=name not in self.not_null)
+            for name, column_type in types.items()
+        ]
+        kwargs = {}
+        if self.partition_by:
+            kwargs['postgresql_partition_by'] = f'LIST ("{self.partition_by[0]}")'
+        # An explicit constraint keeps the declared key column order, which decides what the key's index can serve
+        return Table(self.name, metadata or MetaData(), *columns, PrimaryKeyConstraint(*self.primary_key), **kwargs)
+
+    def partition_name(self, values):
+        """
+        Returns the name of the partition holding rows with the given values of the first len(values) partition
+        columns, e.g. play_by_play_2024_25 or play_by_play_2024_25_regular_season.
+        """
+        suffix = '_'.join(re.sub(r'[^a-z0-9]+', '_', str(v).lower()).strip('_') for v in values)
+        return f'{self.name}_{suffix}'
+
+    def partition_ddl(self, values):
+        """
+        Returns the CREATE TABLE statement for the partition holding rows with the given partition column values.
+        Partitions above the last level are themselves partitioned on the next column.
+        """
+        parent = self.partition_name(values[:-1]) if len(values) > 1 else self.name
+        literal = str(values[-1]).replace("'", "''")
+        ddl = (f'CREATE TABLE IF NOT EXISTS {self.partition_name(values)} PARTITION OF {parent} '
+               f"FOR VALUES IN ('{literal}')")
+        if len(values) < len(self.partition_by):
+            ddl += f' PARTITION BY LIST ("{self.partition_by[len(values)]}")'
+        return ddl + ';'
+
+    def cast(self, df):
+        """
+        Returns df with declared integer and float columns cast to the matching (nullable) pandas dtype, so rows are
+        written with the declared types rather than the floats left behind by fill_nulls.
+        """
+        converted = {}
+        for name, column_type in self.columns.items():
+            if name not in df.columns:
+                continue
+            dtype = PANDAS_DTYPES.get(type(column_type))
+            if dtype is None or df[name].dtype == dtype:
+                continue
+            values = df[name]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values)
+            converted[name] = values.astype(dtype)
+        return df.assign(**converted) if converted else df
+
+
+def infer_column_type(series):
+    if series is None:
+        return Text()
+    if pd.api.types.is_bool_dtype(series):
+        return Boolean()
+    if pd.api.types.is_integer_dtype(series):
+        return BigInteger()
+    if pd.api.types.is_float_dtype(series):
+        return Float()
+    return Text()
+
+
+def player_columns(n):
+    """
+    Columns describing the nth player of a play by play event.
+    """
+    return {
+        f'PERSON{n}TYPE': SmallInteger(),
+        f'PLAYER{n}_ID': Integer(),
+        f'PLAYER{n}_NAME': Text(),
+        f'PLAYER{n}_TEAM_ID': Integer(),
+        f'PLAYER{n}_TEAM_CITY': Text(),
+        f'PLAYER{n}_TEAM_NICKNAME': Text(),
+        f'PLAYER{n}_TEAM_ABBREVIATION': CHAR(3),
+    }
+
+
+PLAY_BY_PLAY_COLUMNS = {
+    Columns.GAME_ID: GAME_ID_TYPE,
+    Columns.EVENTNUM: SmallInteger(),
+    Columns.EVENTMSGTYPE: SmallInteger(),
+    Columns.EVENTMSGACTIONTYPE: SmallInteger(),
+    Columns.PERIOD: SmallInteger(),
+    'WCTIMESTRING': Text(),
+    Columns.PCTIMESTRING: String(5),
+    'HOMEDESCRIPTION': Text(),
+    'NEUTRALDESCRIPTION': Text(),
+    'VISITORDESCRIPTION': Text(),
+    'SCORE': Text(),
+    'SCOREMARGIN': Text(),
+    **player_columns(1),
+    **player_columns(2),
+    **player_columns(3),
+    'VIDEO_AVAILABLE_FLAG': SmallInteger(),
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+}
+
+PLAY_BY_PLAY_WITH_PLAYERS_COLUMNS = {
+    **PLAY_BY_PLAY_COLUMNS,
+    Columns.SECONDS_FROM_START: SmallInteger(),
+    **{f'{Columns.TEAM1_PLAYER}{i + 1}': Integer() for i in range(5)},
+    **{f'{Columns.TEAM2_PLAYER}{i + 1}': Integer() for i in range(5)},
+}
+
+ROTATIONS_COLUMNS = {
+    Columns.GAME_ID: GAME_ID_TYPE,
+    Columns.TEAM_ID: Integer(),
+    Columns.TEAM_NAME: Text(),
+    Columns.PLAYER_ID: Integer(),
+    Columns.PLAYER_FIRST_NAME: Text(),
+    Columns.PLAYER_LAST_NAME: Text(),
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+    Columns.STINTS: Text(),
+}
+
+TEAM_GAME_LOG_COLUMNS = {
+    'SEASON_ID': CHAR(5),
+    Columns.TEAM_ID: Integer(),
+    'TEAM_ABBREVIATION': CHAR(3),
+    Columns.TEAM_NAME: Text(),
+    Columns.GAME_ID: GAME_ID_TYPE,
+    'GAME_DATE': Text(),
+    'MATCHUP': Text(),
+    'WL': CHAR(1),
+    'MIN': REAL(),
+    **{stat: SmallInteger() for stat in ['FGM', 'FGA', 'FG3M', 'FG3A', 'FTM', 'FTA', 'OREB', 'DREB', 'REB', 'AST',
+                                         'STL', 'BLK', 'TOV', 'PF', 'PTS', 'PLUS_MINUS', 'VIDEO_AVAILABLE']},
+    **{pct: REAL() for pct in ['FG_PCT', 'FG3_PCT', 'FT_PCT']},
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+}
+
+PLAYERS_ON_COURT_AT_START_OF_PERIOD_COLUMNS = {
+    Columns.GAME_ID: GAME_ID_TYPE,
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+    Columns.PERIOD: SmallInteger(),
+    Columns.PLAYER_ID: Integer(),
+    Columns.TEAM_ID: Integer(),
+}
+
+SHOT_DETAILS_COLUMNS = {
+    'GRID_TYPE': Text(),
+    Columns.GAME_ID: GAME_ID_TYPE,
+    'GAME_EVENT_ID': SmallInteger(),
+    Columns.PLAYER_ID: Integer(),
+    Columns.PLAYER_NAME: Text(),
+    Columns.TEAM_ID: Integer(),
+    Columns.TEAM_NAME: Text(),
+    Columns.PERIOD: SmallInteger(),
+    'MINUTES_REMAINING': SmallInteger(),
+    'SECONDS_REMAINING': SmallInteger(),
+    'EVENT_TYPE': Text(),
+    'ACTION_TYPE': Text(),
+    'SHOT_TYPE': Text(),
+    'SHOT_ZONE_BASIC': Text(),
+    'SHOT_ZONE_AREA': Text(),
+    'SHOT_ZONE_RANGE': Text(),
+    'SHOT_DISTANCE': SmallInteger(),
+    'LOC_X': SmallInteger(),
+    'LOC_Y': SmallInteger(),
+    'SHOT_ATTEMPTED_FLAG': SmallInteger(),
+    'SHOT_MADE_FLAG': SmallInteger(),
+    'GAME_DATE': CHAR(8),
+    'HTM': CHAR(3),
+    'VTM': CHAR(3),
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+}
+
+# One row per stage (the table it writes) and item (a game, or a player-team combo for shot_details)
+INGESTION_MANIFEST_COLUMNS = {
+    Columns.STAGE: String(40),
+    Columns.SEASON: SEASON_COLUMN_TYPE,
+    Columns.SEASON_TYPE: SEASON_TYPE_TYPE,
+    Columns.ITEM_ID: String(40),
+    Columns.STATUS: String(10),
+    Columns.ROW_COUNT: Integer(),
+    Columns.CONTENT_HASH: CHAR(16),
+    Columns.ERROR: Text(),
+    Columns.STARTED_AT: DateTime(timezone=True),
+    Columns.UPDATED_AT: DateTime(timezone=True),
+}
+
+KEY_COLUMNS = (Columns.GAME_ID, Columns.SEASON, Columns.SEASON_TYPE)
+
+# The event tables grow by millions of rows a season and are almost always read a season at a time, so they are
+# partitioned by SEASON. Adding Columns.SEASON_TYPE to partition_by (and the primary key) sub-partitions each season.
+#
+# Indexes follow the queries the ETLs run. Reads by GAME_ID are served by the primary keys, which lead with it (or
+# with PLAYER_ID for shot_details, which gets its own GAME_ID index). Game lists and player-team combos are selected
+# by (SEASON, SEASON_TYPE) and covered by INCLUDE columns. The season partitions of the event tables need no other
+# index: SEASON_TYPE has two values and rows are not stored in its order, so an index on it would not beat a scan of
+# the partition.
+
+SCHEMAS = {
+    schema.name: schema for schema in [
+        TableSchema(Tables.PLAY_BY_PLAY, PLAY_BY_PLAY_COLUMNS,
+                    primary_key=(Columns.GAME_ID, Columns.EVENTNUM, Columns.SEASON),
+                    not_null=KEY_COLUMNS + (Columns.PERIOD,),
+                    partition_by=(Columns.SEASON,)),
+        TableSchema(Tables.PLAY_BY_PLAY_WITH_PLAYERS, PLAY_BY_PLAY_WITH_PLAYERS_COLUMNS,
+                    primary_key=(Columns.GAME_ID, Columns.EVENTNUM, Columns.SEASON),
+                    not_null=KEY_COLUMNS + (Columns.PERIOD,),
+                    partition_by=(Columns.SEASON,)),
+        TableSchema(Tables.ROTATIONS, ROTATIONS_COLUMNS,
+                    primary_key=(Columns.GAME_ID, Columns.PLAYER_ID),
+                    not_null=KEY_COLUMNS + (Columns.TEAM_ID,),
+                    indexes=[Index((Columns.SEASON, Columns.SEASON_TYPE, Columns.PLAYER_ID),
+                                   include=(Columns.TEAM_ID,))]),
+        TableSchema(Tables.TEAM_GAME_LOG, TEAM_GAME_LOG_COLUMNS,
+                    primary_key=(Columns.GAME_ID, Columns.TEAM_ID),
+                    not_null=KEY_COLUMNS,
+                    indexes=[Index((Columns.SEASON, Columns.SEASON_TYPE), include=(Columns.GAME_ID,))]),
+        TableSchema(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD, PLAYERS_ON_COURT_AT_START_OF_PERIOD_COLUMNS,
+                    primary_key=(Columns.GAME_ID, Columns.PERIOD, Columns.PLAYER_ID),
+                    not_null=KEY_COLUMNS + (Columns.TEAM_ID,)),
+        TableSchema(Tables.SHOT_DETAILS, SHOT_DETAILS_COLUMNS,
+                    primary_key=(Columns.PLAYER_ID, Columns.GAME_ID, 'GAME_EVENT_ID', Columns.SEASON),
+                    not_null=(Columns.SEASON_TYPE, Columns.TEAM_ID),
+                    partition_by=(Columns.SEASON,),
+                    indexes=[Index((Columns.GAME_ID,))]),
+        # Keyed for the delta lookup: the completed items of a stage for one season and season type
+        TableSchema(Tables.INGESTION_MANIFEST, INGESTION_MANIFEST_COLUMNS,
+                    primary_key=(Columns.STAGE, Columns.SEASON, Columns.SEASON_TYPE, Columns.ITEM_ID),
+                    not_null=(Columns.STATUS, Columns.UPDATED_AT)),
+    ]
+}
+
+
+def get_schema(table_name):
+    """
+    Returns the TableSchema declared for table_name, or None for tables whose types are inferred by pandas.
+    """
+    return SCHEMAS.get(table_name)
@@ -0,0 +1,72 @@
+import pandas as pd
+
+from database.db_constants import Columns
+
+
+class GameBatch:
+    """
+    Input tables for a batch of games, sliced per game on demand.
+    """
+
+    def __init__(self, frames):
+        self._groups = {table: df.groupby(Columns.GAME_ID, sort=False) for table, df in frames.items()}
+        self._frames = frames
+
+    def get(self, table_name, game_id):
+        """
+        Returns the rows of table_name for game_id, or an empty DataFrame with the projected columns.
+        """
+        groups = self._groups[table_name]
+        if game_id in groups.groups:
+            return groups.get_group(game_id).reset_index(drop=True)
+        return self._frames[table_name].iloc[0:0]
+
+    def game(self, game_id):
+        """
+        Returns {table_name: rows for game_id} for every table in the batch.
+        """
+        return {table: self.get(table, game_id) for table in self._frames}
+
+
+class GameBatchLoader:
+    """
+    Loads the input tables an ETL stage needs for a batch of games with one query per table, instead of one query per
+    table per game. columns_by_table maps each table to the columns the stage reads; GAME_ID is always included and
+    columns the table does not have are skipped. None selects every column.
+    """
+
+    def __init__(self, client, columns_by_table):
+        self.client = client
+        self.columns_by_table = columns_by_table
+
+    def projection(self, table_name):
+        existing = self.client.table_columns(table_name)
+        declared = self.columns_by_table[table_name]
+        if declared is None:
+            return [c for c in existing if c != Columns.ID]
+        return [Columns.GAME_ID] + [c for c in declared if c in existing and c != Columns.GAME_ID]
+
+    def load(self, game_ids, season=None):
+        """
+        Returns a GameBatch with every table's rows for game_ids. Passing the season lets partitioned tables scan only
+        that season's partition.
+        """
+        game_ids = tuple(game_ids)
+        frames = {}
+        for table_name in self.columns_by_table:
+            if not self.client.table_exists(table_name):
+                frames[table_name] = pd.DataFrame(columns=[Columns.GAME_ID] + (self.columns_by_table[table_name] or []))
+                continue
+            column_list = ', '.join(f'"{c}"' for c in self.projection(table_name))
+            q = f'SELECT {column_list} FROM {table_name} WHERE "{Columns.GAME_ID}" IN :game_ids'
+            params = {'game_ids': game_ids}
+            if season is not None:
+                q += f' AND "{Columns.SEASON}" = :season'
+                params['season'] = season
+            df = self.client.read(q, params=params)
+            if df is None:
+                raise Exception(f"Could not read {table_name} for {len(game_ids)} games")
+            # CHAR game ids come back as stored, strip so lookups by the plain id match
+            df[Columns.GAME_ID] = df[Columns.GAME_ID].str.strip()
+            frames[table_name] = df
+        return GameBatch(frames)
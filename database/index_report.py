@@ -0,0 +1,111 @@
+"""
+Reports how often each index has been used since the statistics were last reset, and its size, from
+pg_stat_user_indexes. Indexes on partitions are added up into the partitioned table's index. Lists the unused indexes
+and, for tables with a schema in db_schemas, the indexes that are not declared there (such as the old single column
+idx_ indexes) and the declared indexes that are missing.
+
+Usage:
+    ./.venv/bin/python -m database.index_report
+    ./.venv/bin/python -m database.index_report --table rotations --create
+"""
+import argparse
+
+import pandas as pd
+from sqlalchemy import text
+
+from database.db_client import database_client
+from database.db_schemas import SCHEMAS
+
+INDEX_USAGE = '''
+    SELECT
+        COALESCE(parent_index.indrelid::regclass::text, s.relname) AS table_name,
+        COALESCE(inh.inhparent::regclass::text, s.indexrelname) AS index_name,
+        BOOL_OR(i.indisprimary) AS is_primary,
+        BOOL_OR(i.indisunique) AS is_unique,
+        SUM(s.idx_scan)::bigint AS scans,
+        SUM(s.idx_tup_read)::bigint AS tuples_read,
+        SUM(pg_relation_size(s.indexrelid))::bigint AS size_bytes
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i ON i.indexrelid = s.indexrelid
+    LEFT JOIN pg_inherits inh ON inh.inhrelid = s.indexrelid
+    LEFT JOIN pg_index parent_index ON parent_index.indexrelid = inh.inhparent
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+'''
+
+STATS_RESET = 'SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()'
+
+
+def index_usage(conn):
+    return pd.DataFrame(conn.execute(text(INDEX_USAGE)).mappings().all(),
+                        columns=['table_name', 'index_name', 'is_primary', 'is_unique', 'scans', 'tuples_read',
+                                 'size_bytes'])
+
+
+def unused_indexes(usage):
+    """
+    Returns the indexes never scanned. Primary key and unique indexes are left out, they enforce constraints.
+    """
+    return usage[(usage['scans'] == 0) & ~usage['is_primary'] & ~usage['is_unique']]
+
+
+def undeclared_indexes(usage):
+    """
+    Returns the secondary indexes of tables with a schema in db_schemas that the schema does not declare.
+    """
+    declared = {index.name(name) for name, schema in SCHEMAS.items() for index in schema.indexes}
+    return usage[usage['table_name'].isin(SCHEMAS) & ~usage['is_primary'] & ~usage['is_unique']
+                 & ~usage['index_name'].isin(declared)]
+
+
+def missing_indexes(usage):
+    """
+    Returns (table_name, index) for the declared indexes of existing tables that have not been created.
+    """
+    existing = set(usage['index_name'])
+    tables = set(usage['table_name'])
+    return [(name, index) for name, schema in SCHEMAS.items() if name in tables
+            for index in schema.indexes if index.name(name) not in existing]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report index usage and unused, undeclared or missing indexes.')
+    parser.add_argument('-t', '--table', action='store', dest='table', help='Only report this table')
+    parser.add_argument('-cr', '--create', action='store_true', dest='create',
+                        help='Create the declared indexes that are missing')
+    args = parser.parse_args()
+
+    with database_client.engine.connect() as conn:
+        usage = index_usage(conn)
+        stats_reset = conn.execute(text(STATS_RESET)).scalar()
+    if args.table:
+        usage = usage[usage['table_name'] == args.table]
+
+    print(f"Index usage since {stats_reset or 'the statistics were created'}:")
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(usage.assign(size_mb=(usage['size_bytes'] / 1e6).round(1)).drop(columns='size_bytes').to_string(index=False))
+
+    unused = unused_indexes(usage)
+    print(f"\n{len(unused)} unused indexes, {unused['size_bytes'].sum() / 1e6:.1f}MB:")
+    for row in unused.itertuples():
+        print(f"  {row.index_name} on {row.table_name} ({row.size_bytes / 1e6:.1f}MB)")
+
+    undeclared = undeclared_indexes(usage)
+    if not undeclared.empty:
+        print(f"\n{len(undeclared)} indexes not declared in db_schemas:")
+        for row in undeclared.itertuples():
+            print(f"  DROP INDEX {row.index_name};  -- {row.scans} scans, {row.size_bytes / 1e6:.1f}MB")
+
+    missing = missing_indexes(usage)
+    if missing:
+        print(f"\n{len(missing)} declared indexes missing:")
+        for table_name, index in missing:
+            print(f"  {index.ddl(table_name)}")
+        if args.create:
+            for table_name in sorted({table_name for table_name, _ in missing}):
+                database_client.create_indexes(SCHEMAS[table_name])
+    database_client.close()
+
+
+if __name__ == '__main__':
+    main()
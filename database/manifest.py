@@ -0,0 +1,226 @@
+"""
+Ingestion manifest: one row per stage and item recording whether the item was written, how many rows it has, a hash of
+its content and when it was first attempted and last updated. A stage is named after the table it writes and an item
+is a game, or a player-team combo for shot_details. Delta runs read the completed items from this small table instead
+of scanning the stage's table.
+
+Usage:
+    ./.venv/bin/python -m database.manifest --season 2024-25 --season_type "Regular Season"
+    ./.venv/bin/python -m database.manifest --backfill
+"""
+import argparse
+
+import pandas as pd
+from sqlalchemy import text
+
+from database.db_client import database_client
+from database.db_constants import Tables, Columns
+from database.db_schemas import get_schema
+
+COMPLETE = 'complete'
+FAILED = 'failed'
+
+# Columns identifying an item of each stage, joined with '-' into ITEM_ID
+ITEM_COLUMNS = {
+    Tables.PLAY_BY_PLAY: (Columns.GAME_ID,),
+    Tables.PLAY_BY_PLAY_WITH_PLAYERS: (Columns.GAME_ID,),
+    Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD: (Columns.GAME_ID,),
+    Tables.ROTATIONS: (Columns.GAME_ID,),
+    Tables.SHOT_DETAILS: (Columns.PLAYER_ID, Columns.TEAM_ID),
+}
+
+UPSERT = f'''
+    INSERT INTO {Tables.INGESTION_MANIFEST} ("{Columns.STAGE}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}",
+        "{Columns.ITEM_ID}", "{Columns.STATUS}", "{Columns.ROW_COUNT}", "{Columns.CONTENT_HASH}", "{Columns.ERROR}",
+        "{Columns.STARTED_AT}", "{Columns.UPDATED_AT}")
+    VALUES (:stage, :season, :season_type, :item_id, :status, :row_count, :content_hash, :error, now(), now())
+    ON CONFLICT ("{Columns.STAGE}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}", "{Columns.ITEM_ID}") DO UPDATE SET
+        "{Columns.STATUS}" = EXCLUDED."{Columns.STATUS}",
+        "{Columns.ROW_COUNT}" = COALESCE(EXCLUDED."{Columns.ROW_COUNT}", {Tables.INGESTION_MANIFEST}."{Columns.ROW_COUNT}"),
+        "{Columns.CONTENT_HASH}" = COALESCE(EXCLUDED."{Columns.CONTENT_HASH}", {Tables.INGESTION_MANIFEST}."{Columns.CONTENT_HASH}"),
+        "{Columns.ERROR}" = EXCLUDED."{Columns.ERROR}",
+        "{Columns.UPDATED_AT}" = now()
+'''
+
+# A failed attempt does not undo an earlier complete write, whose rows are still in the stage's table
+MARK_FAILED = UPSERT + f'''
+    WHERE {Tables.INGESTION_MANIFEST}."{Columns.STATUS}" <> '{COMPLETE}'
+'''
+
+
+def item_id(*values):
+    """
+    Returns the ITEM_ID for the values of a stage's ITEM_COLUMNS, e.g. item_id(player_id, team_id).
+    """
+    return '-'.join(str(int(v)) if isinstance(v, float) else str(v) for v in values)
+
+
+def content_hash(df):
+    """
+    Returns a hex digest of the rows of df that does not depend on row or column order.
+    """
+    df = df[sorted(df.columns)]
+    return '{:016x}'.format(int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+
+class IngestionManifest:
+
+    def __init__(self, client):
+        self.client = client
+        self._backfilled = set()
+
+    def ensure_table(self):
+        if not self.client.table_exists(Tables.INGESTION_MANIFEST):
+            self.client.create_table(get_schema(Tables.INGESTION_MANIFEST))
+
+    def recorder(self, stage):
+        """
+        Returns an after_write hook for PostgresClient.write that marks every item in the written frame complete,
+        in the same transaction as the rows themselves.
+        """
+        self.ensure_table()
+        # Backfill before the first write, which would otherwise make the stage look already backfilled
+        self.backfill(stage)
+
+        def record(conn, df):
+            conn.execute(text(UPSERT), self.entries(stage, df))
+        return record
+
+    def entries(self, stage, df):
+        keys = [Columns.SEASON, Columns.SEASON_TYPE, *ITEM_COLUMNS[stage]]
+        return [
+            {
+                'stage': stage, 'season': key[0], 'season_type': key[1], 'item_id': item_id(*key[2:]),
+                'status': COMPLETE, 'row_count': len(rows), 'content_hash': content_hash(rows), 'error': None,
+            }
+            for key, rows in df.groupby(keys, sort=False)
+        ]
+
+    def mark_failed(self, stage, season, season_type, item, error):
+        """
+        Records that an item could not be fetched or processed, so the next delta run retries it. An item that is
+        already complete stays complete.
+        """
+        self.ensure_table()
+        self.backfill(stage)
+        entry = {
+            'stage': stage, 'season': season, 'season_type': season_type, 'item_id': item,
+            'status': FAILED, 'row_count': None, 'content_hash': None, 'error': str(error),
+        }
+        with self.client.engine.begin() as conn:
+            conn.execute(text(MARK_FAILED), [entry])
+
+    def completed(self, stage, season, season_type):
+        """
+        Returns the set of ITEM_IDs of the stage that are complete for the season and season type.
+        """
+        self.ensure_table()
+        self.backfill(stage)
+        q = f'''
+            SELECT "{Columns.ITEM_ID}" FROM {Tables.INGESTION_MANIFEST}
+            WHERE "{Columns.STAGE}" = :stage AND "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :season_type
+            AND "{Columns.STATUS}" = :status
+        '''
+        result = self.client.read(q, params={'stage': stage, 'season': season, 'season_type': season_type,
+                                             'status': COMPLETE})
+        if result is None or result.empty:
+            return set()
+        return set(result[Columns.ITEM_ID].tolist())
+
+    def backfill(self, stage, force=False):
+        """
+        Records the items already in the stage's table the first time the manifest is used for it, with one scan of
+        the table. Content hashes are left empty until the item is written again.
+        """
+        if stage in self._backfilled and not force:
+            return
+        self._backfilled.add(stage)
+        q = f'SELECT 1 FROM {Tables.INGESTION_MANIFEST} WHERE "{Columns.STAGE}" = :stage LIMIT 1'
+        existing = self.client.read(q, params={'stage': stage})
+        if existing is not None and not existing.empty and not force:
+            return
+        if not self.client.table_exists(stage):
+            return
+        item_list = ", '-', ".join(f'"{c}"' for c in ITEM_COLUMNS[stage])
+        q = f'''
+            INSERT INTO {Tables.INGESTION_MANIFEST} ("{Columns.STAGE}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}",
+                "{Columns.ITEM_ID}", "{Columns.STATUS}", "{Columns.ROW_COUNT}", "{Columns.STARTED_AT}",
+                "{Columns.UPDATED_AT}")
+            SELECT :stage, "{Columns.SEASON}", "{Columns.SEASON_TYPE}", CONCAT({item_list}), :status, COUNT(*), now(),
+                now()
+            FROM {stage}
+            GROUP BY "{Columns.SEASON}", "{Columns.SEASON_TYPE}", {', '.join(f'"{c}"' for c in ITEM_COLUMNS[stage])}
+            ON CONFLICT DO NOTHING
+        '''
+        with self.client.engine.begin() as conn:
+            added = conn.execute(text(q), {'stage': stage, 'status': COMPLETE}).rowcount
+        print(f"Backfilled {added} {stage} items into {Tables.INGESTION_MANIFEST}.")
+
+    def filter_delta(self, stage, season, season_type, items):
+        """
+        Returns the items (ITEM_IDs) not yet complete for the stage, printing how many were skipped.
+        """
+        done = self.completed(stage, season, season_type)
+        remaining = [item for item in items if item not in done]
+        print(f"Delta mode: {len(items) - len(remaining)} items already in {stage}, {len(remaining)} remaining to "
+              f"process for season {season}.")
+        return remaining
+
+    def summary(self, season=None, season_type=None):
+        """
+        Returns item counts and rows per stage and status, optionally for one season and season type.
+        """
+        self.ensure_table()
+        q = f'''
+            SELECT "{Columns.STAGE}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}", "{Columns.STATUS}",
+                COUNT(*) AS "ITEMS", COALESCE(SUM("{Columns.ROW_COUNT}"), 0) AS "ROWS",
+                MAX("{Columns.UPDATED_AT}") AS "{Columns.UPDATED_AT}"
+            FROM {Tables.INGESTION_MANIFEST}
+            WHERE (CAST(:season AS TEXT) IS NULL OR "{Columns.SEASON}" = :season)
+            AND (CAST(:season_type AS TEXT) IS NULL OR "{Columns.SEASON_TYPE}" = :season_type)
+            GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+        '''
+        return self.client.read(q, params={'season': season, 'season_type': season_type})
+
+    def failures(self, season=None, season_type=None):
+        """
+        Returns the items whose last attempt failed, with the error.
+        """
+        self.ensure_table()
+        q = f'''
+            SELECT "{Columns.STAGE}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}", "{Columns.ITEM_ID}",
+                "{Columns.ERROR}", "{Columns.UPDATED_AT}"
+            FROM {Tables.INGESTION_MANIFEST}
+            WHERE "{Columns.STATUS}" = :status
+            AND (CAST(:season AS TEXT) IS NULL OR "{Columns.SEASON}" = :season)
+            AND (CAST(:season_type AS TEXT) IS NULL OR "{Columns.SEASON_TYPE}" = :season_type)
+            ORDER BY "{Columns.UPDATED_AT}" DESC
+        '''
+        return self.client.read(q, params={'status': FAILED, 'season': season, 'season_type': season_type})
+
+
+ingestion_manifest = IngestionManifest(database_client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the ingestion manifest, or backfill it from existing tables.')
+    parser.add_argument('-s', '--season', action='store', dest='season', help='Only show this season')
+    parser.add_argument('-st', '--season_type', action='store', dest='season_type', help='Only show this season type')
+    parser.add_argument('-b', '--backfill', action='store_true', dest='backfill',
+                        help='Record the items already in every stage table, keeping existing manifest rows')
+    args = parser.parse_args()
+
+    ingestion_manifest.ensure_table()
+    if args.backfill:
+        for stage in ITEM_COLUMNS:
+            ingestion_manifest.backfill(stage, force=True)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(ingestion_manifest.summary(args.season, args.season_type))
+        failed = ingestion_manifest.failures(args.season, args.season_type)
+        if failed is not None and not failed.empty:
+            print(failed)
+    database_client.close()
+
+
+if __name__ == '__main__':
+    main()
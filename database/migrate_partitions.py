@@ -0,0 +1,116 @@
+"""
+Rebuilds the tables whose schema in db_schemas declares partition_by (play_by_play, play_by_play_with_players and
+shot_details) as partitioned tables, copying the existing rows into one partition per season. Works on tables still
+keyed on the old string id as well as on tables already migrated to composite keys.
+
+Usage:
+    ./.venv/bin/python -m database.migrate_partitions --dry_run
+    ./.venv/bin/python -m database.migrate_partitions --table play_by_play --keep_old
+"""
+import argparse
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database.db_client import database_client
+from database.db_constants import Columns
+from database.db_schemas import SCHEMAS
+from database.migrate_primary_keys import count_duplicate_keys, index_size, primary_key_constraint
+
+STANDARD_INDEX_COLUMNS = [Columns.GAME_ID, Columns.SEASON, Columns.SEASON_TYPE]
+
+
+def is_partitioned(conn, table_name):
+    q = "SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:table_name AS regclass)"
+    return conn.execute(text(q), {'table_name': table_name}).scalar()
+
+
+def migrate_table(schema, dry_run=False, keep_old=False):
+    """
+    Renames the table to <table>_unpartitioned, creates the partitioned table and its partitions, copies the rows
+    across (casting declared columns to their types and dropping the old 'id') and drops the old table unless
+    keep_old. Returns False if the table could not be migrated.
+    """
+    table_name = schema.name
+    old_name = f'{table_name}_unpartitioned'
+    if not database_client.table_exists(table_name):
+        print(f"{table_name}: does not exist, skipping.")
+        return True
+
+    key_list = ', '.join(f'"{c}"' for c in schema.primary_key)
+    partition_list = ', '.join(f'"{c}"' for c in schema.partition_by)
+    with database_client.engine.begin() as conn:
+        if is_partitioned(conn, table_name):
+            print(f"{table_name}: already partitioned.")
+            return True
+        before = index_size(conn, table_name)
+        duplicates = count_duplicate_keys(conn, table_name, key_list)
+        if duplicates:
+            print(f"{table_name}: {duplicates} values of ({key_list}) appear more than once, not migrating.")
+            return False
+        partitions = conn.execute(text(f'SELECT DISTINCT {partition_list} FROM {table_name};')).fetchall()
+        if dry_run:
+            print(f"{table_name}: would partition by ({partition_list}) into {len(partitions)} partitions, "
+                  f"indexes currently {before / 1e6:.1f}MB.")
+            return True
+
+        old = database_client.reflect_table(table_name, conn)
+        columns = [c.name for c in old.columns if c.name != Columns.ID]
+        extra_columns = {c.name: c.type for c in old.columns if c.name != Columns.ID and c.name not in schema.columns}
+
+        # Free the constraint and index names for the new table
+        constraint = primary_key_constraint(conn, table_name)
+        conn.execute(text(f'ALTER TABLE {table_name} RENAME TO {old_name};'))
+        if constraint:
+            conn.execute(text(f'ALTER TABLE {old_name} DROP CONSTRAINT "{constraint}";'))
+        for col in STANDARD_INDEX_COLUMNS:
+            conn.execute(text(f'DROP INDEX IF EXISTS idx_{table_name}_{col.lower()};'))
+        for index in schema.indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index.name(table_name)};'))
+
+        schema.table(extra_columns=extra_columns).create(conn)
+        for row in partitions:
+            for depth in range(1, len(row) + 1):
+                conn.execute(text(schema.partition_ddl(tuple(row[:depth]))))
+
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        select_list = ', '.join(
+            f'"{c}"::{schema.columns[c].compile(dialect=postgresql.dialect())}' if c in schema.columns else f'"{c}"'
+            for c in columns
+        )
+        conn.execute(text(f'INSERT INTO {table_name} ({column_list}) SELECT {select_list} FROM {old_name};'))
+        if not keep_old:
+            conn.execute(text(f'DROP TABLE {old_name};'))
+
+    database_client.invalidate_schema(table_name)
+    database_client.add_standard_indexes(table_name, pd.DataFrame(columns=columns))
+    with database_client.engine.connect() as conn:
+        after = index_size(conn, table_name)
+    print(f"{table_name}: partitioned by ({partition_list}) into {len(partitions)} partitions, "
+          f"indexes {before / 1e6:.1f}MB -> {after / 1e6:.1f}MB.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the large event tables as season partitioned tables.')
+    parser.add_argument('-t', '--table', action='store', dest='table', help='Only migrate this table')
+    parser.add_argument('-d', '--dry_run', action='store_true', dest='dry_run',
+                        help='Report the partitions that would be created without altering anything')
+    parser.add_argument('-k', '--keep_old', action='store_true', dest='keep_old',
+                        help='Keep the original table as <table>_unpartitioned')
+    args = parser.parse_args()
+
+    partitioned = {name: schema for name, schema in SCHEMAS.items() if schema.partition_by}
+    if args.table and args.table not in partitioned:
+        raise Exception(f"Table '{args.table}' is not partitioned. Partitioned tables: {', '.join(partitioned)}")
+    schemas = [partitioned[args.table]] if args.table else list(partitioned.values())
+    failed = [schema.name for schema in schemas
+              if not migrate_table(schema, dry_run=args.dry_run, keep_old=args.keep_old)]
+    database_client.close()
+    if failed:
+        raise Exception(f"Could not migrate: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
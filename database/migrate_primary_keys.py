@@ -0,0 +1,102 @@
+"""
+Migrates tables created with the string 'id' primary key (built by the old utils.add_id) to the composite primary keys
+declared in db_schemas, and prints each table's index size before and after.
+
+Usage:
+    ./.venv/bin/python -m database.migrate_primary_keys
+    ./.venv/bin/python -m database.migrate_primary_keys --table play_by_play --dry_run
+"""
+import argparse
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database.db_client import database_client
+from database.db_constants import Columns
+from database.db_schemas import SCHEMAS
+
+
+def index_size(conn, table_name):
+    """
+    Returns the size of the table's indexes in bytes, summed over all partitions of a partitioned table.
+    """
+    q = 'SELECT COALESCE(SUM(pg_indexes_size(relid)), 0) FROM pg_partition_tree(CAST(:table_name AS regclass))'
+    return conn.execute(text(q), {'table_name': table_name}).scalar()
+
+
+def primary_key_constraint(conn, table_name):
+    q = "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table_name AS regclass) AND contype = 'p'"
+    return conn.execute(text(q), {'table_name': table_name}).scalar()
+
+
+def count_duplicate_keys(conn, table_name, key_list):
+    q = f'SELECT COUNT(*) FROM (SELECT 1 FROM {table_name} GROUP BY {key_list} HAVING COUNT(*) > 1) AS dupes'
+    return conn.execute(text(q)).scalar()
+
+
+def migrate_table(schema, dry_run=False):
+    """
+    Replaces the table's 'id' primary key with the schema's composite key, casting the key columns to their declared
+    types and dropping the 'id' column and the now redundant index on the key's leading column.
+    Returns False if the table could not be migrated.
+    """
+    table_name = schema.name
+    if schema.partition_by:
+        print(f"{table_name}: partitioned, migrate it with database.migrate_partitions.")
+        return True
+    if not database_client.table_exists(table_name):
+        print(f"{table_name}: does not exist, skipping.")
+        return True
+    current_key = database_client.primary_key(table_name)
+    if tuple(current_key) == schema.primary_key:
+        print(f"{table_name}: already keyed on {list(schema.primary_key)}.")
+        return True
+
+    key_list = ', '.join(f'"{c}"' for c in schema.primary_key)
+    with database_client.engine.begin() as conn:
+        before = index_size(conn, table_name)
+        duplicates = count_duplicate_keys(conn, table_name, key_list)
+        if duplicates:
+            print(f"{table_name}: {duplicates} values of ({key_list}) appear more than once, not migrating.")
+            return False
+        if dry_run:
+            print(f"{table_name}: would change primary key {current_key} -> {list(schema.primary_key)}, "
+                  f"indexes currently {before / 1e6:.1f}MB.")
+            return True
+
+        constraint = primary_key_constraint(conn, table_name)
+        if constraint:
+            conn.execute(text(f'ALTER TABLE {table_name} DROP CONSTRAINT "{constraint}";'))
+        for col in schema.primary_key:
+            col_type = schema.columns[col].compile(dialect=postgresql.dialect())
+            conn.execute(text(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {col_type} USING "{col}"::{col_type};'))
+        conn.execute(text(f'ALTER TABLE {table_name} DROP COLUMN IF EXISTS {Columns.ID};'))
+        conn.execute(text(f'DROP INDEX IF EXISTS idx_{table_name}_{schema.primary_key[0].lower()};'))
+        conn.execute(text(f'ALTER TABLE {table_name} ADD PRIMARY KEY ({key_list});'))
+        after = index_size(conn, table_name)
+
+    database_client.invalidate_schema(table_name)
+    database_client.create_indexes(schema)
+    print(f"{table_name}: primary key {current_key} -> {list(schema.primary_key)}, "
+          f"indexes {before / 1e6:.1f}MB -> {after / 1e6:.1f}MB.")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate tables from the string id primary key to composite keys.')
+    parser.add_argument('-t', '--table', action='store', dest='table', help='Only migrate this table')
+    parser.add_argument('-d', '--dry_run', action='store_true', dest='dry_run',
+                        help='Report what would change and the current index sizes without altering anything')
+    args = parser.parse_args()
+
+    if args.table and args.table not in SCHEMAS:
+        raise Exception(f"No schema declared for table '{args.table}'. Known tables: {', '.join(SCHEMAS)}")
+    schemas = [SCHEMAS[args.table]] if args.table else list(SCHEMAS.values())
+    failed = [schema.name for schema in schemas if not migrate_table(schema, dry_run=args.dry_run)]
+    database_client.close()
+    if failed:
+        raise Exception(f"Could not migrate: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
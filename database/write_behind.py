@@ -0,0 +1,127 @@
+import queue
+import threading
+
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAX_PENDING = 50
+
+_CLOSE = object()
+
+
+class WriteBehindWriter:
+    """
+    Writes frames to a table on a background thread, so an ETL keeps fetching while earlier games are concatenated
+    and written. Frames are queued with put() and written batch_size at a time. At most max_pending frames wait in the
+    queue; put() blocks when it is full, so a database slower than the API slows the fetch loop down instead of
+    buffering the whole season in memory.
+
+    A failed write is raised from the next put() or from close() unless raise_errors is False, in which case it is
+    printed and the batch is dropped. close() writes what is left and waits for the writer thread. after_write is passed
+    on to PostgresClient.write, e.g. an ingestion manifest recorder.
+
+    With flush_after (seconds), a partial batch is written once no frame has been queued for that long, so a frame
+    waits at most that long for the rest of its batch. after_batch(batch, error) is called on the writer thread after
+    each batch is committed (error None) or has failed.
+
+        with WriteBehindWriter(database_client, Tables.ROTATIONS, total=len(game_ids)) as writer:
+            for gid, df in fetch_rotations(game_ids, ...):
+                writer.put(df)
+    """
+
+    def __init__(self, client, table_name, batch_size=DEFAULT_BATCH_SIZE, max_pending=DEFAULT_MAX_PENDING,
+                 total=None, prepare=None, raise_errors=True, unit='games', after_write=None, flush_after=None,
+                 after_batch=None):
+        self.client = client
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.total = total
+        self.prepare = prepare
+        self.raise_errors = raise_errors
+        self.unit = unit
+        self.after_write = after_write
+        self.flush_after = flush_after
+        self.after_batch = after_batch
+        self.written = 0
+        self.failed = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f'write-behind-{table_name}', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Don't mask the exception that ended the block with a write error
+        self.close(raise_errors=exc_type is None)
+        return False
+
+    def put(self, df):
+        """
+        Queues df to be written, blocking while max_pending frames are already waiting.
+        """
+        if self._closed:
+            raise Exception(f"Writer for {self.table_name} is closed")
+        self._raise_error()
+        self._queue.put(df)
+
+    def close(self, raise_errors=True):
+        """
+        Writes the queued frames and stops the writer thread. Returns the number of frames written.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if raise_errors:
+            self._raise_error()
+        return self.written
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                df = self._queue.get(timeout=self.flush_after if batch else None)
+            except queue.Empty:
+                self._write(batch)
+                batch = []
+                continue
+            if df is _CLOSE:
+                break
+            if self.error is not None:
+                # Keep draining so a blocked put() returns and sees the error
+                continue
+            batch.append(df)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch and self.error is None:
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            all_df = pd.concat(batch)
+            if self.prepare is not None:
+                all_df = self.prepare(all_df)
+            self.client.write(all_df, self.table_name, after_write=self.after_write)
+        except Exception as e:
+            self.failed += len(batch)
+            if self.raise_errors:
+                self.error = e
+            else:
+                print(f"Failed to write {len(batch)} {self.unit} to {self.table_name}: {e}")
+            if self.after_batch is not None:
+                self.after_batch(batch, e)
+            return
+        self.written += len(batch)
+        progress = f"{self.written}/{self.total}" if self.total is not None else f"{self.written}"
+        print(f"Wrote {progress} {self.unit} to {self.table_name}")
+        if self.after_batch is not None:
+            self.after_batch(batch, None)
@@ -0,0 +1,336 @@
+import argparse
+import queue
+import time
+from api.smart import smart
+from database.db_client import database_client
+from database.db_constants import Tables, Columns
+from database.manifest import ingestion_manifest
+from database.write_behind import WriteBehindWriter
+from etl import play_by_play, rotations, players_on_court_at_start_of_period, play_by_play_with_players, shot_details
+from utils.arg_parser import season_arg, season_type_arg, delta_arg, cache_arg, rate_limit_arg, hedge_arg, metrics_arg, stand_in_arg, stage_workers_arg
+from utils.utils import add_season_and_type, fill_nulls
+from utils.workers import Workers, THREAD, PROCESS
+
+"""
+Runs every ETL stage for the games of the given seasons in one process. Stages form a dependency graph and each game
+moves on to a stage as soon as the rows of the stages it reads have been written, instead of each stage waiting for
+the previous one to finish the whole season:
+
+    team_game_log -> play_by_play -> players_on_court_at_start_of_period ..> play_by_play_with_players
+                  -> rotations ----------------------------------------------^
+                               -> shot_details (the player-team combos of the game's rotations)
+
+play_by_play_with_players only falls back to players_on_court_at_start_of_period for a period's starters, so it
+waits for that stage to land or fail for the game (..>) rather than needing it to land.
+"""
+
+# Seconds a partial batch waits for more frames before it is written, so a game lands at most this late
+FLUSH_AFTER = 1.0
+
+
+class Stage:
+    """
+    A node of the pipeline. fn(items, season, season_type) returns [(item, frame, error)] for a task of up to
+    batch_size items; a frame that is None or empty has nothing to write. Items are game ids, except for
+    team_game_log (seasons) and shot_details ((season, player_id, team_id) combos).
+    A game reaches the stage once every stage in depends_on has landed for it, and every stage in after has either
+    landed or failed for it.
+    """
+
+    def __init__(self, name, fn, depends_on=(), after=(), workers=1, executor=THREAD, batch_size=1,
+                 writer_batch_size=10, unit='games'):
+        self.name = name
+        self.fn = fn
+        self.depends_on = depends_on
+        self.after = after
+        self.workers = workers
+        self.executor = executor
+        self.batch_size = batch_size
+        self.writer_batch_size = writer_batch_size
+        self.unit = unit
+
+
+class StageStats:
+
+    def __init__(self):
+        self.landed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_landed = None
+
+    def throughput(self):
+        if self.first_start is None or self.last_landed is None or self.last_landed <= self.first_start:
+            return 0.0
+        return self.landed / (self.last_landed - self.first_start)
+
+
+# --- Stage functions, run on the stage's workers ---
+def _per_item(items, fn):
+    results = []
+    for item in items:
+        try:
+            results.append((item, fn(item), None))
+        except Exception as e:
+            results.append((item, None, str(e)))
+    return results
+
+def fetch_team_game_log(seasons, season, season_type):
+    def fetch(season):
+        df = smart.get_teams_game_log(season_type=season_type, season=season)
+        if df is None or df.empty:
+            return None
+        return fill_nulls(add_season_and_type(df, season, season_type))
+    return _per_item(seasons, fetch)
+
+def fetch_play_by_play(game_ids, season, season_type):
+    return _per_item(game_ids, play_by_play.fetch_play_by_play_by_game_id)
+
+def fetch_rotations(game_ids, season, season_type):
+    return _per_item(game_ids, lambda gid: rotations.fetch_rotation(gid, season, season_type))
+
+def fetch_players_on_court(game_ids, season, season_type):
+    return _per_item(game_ids, lambda gid: players_on_court_at_start_of_period.process_game(gid, season, season_type))
+
+def process_play_by_play_with_players(game_ids, season, season_type):
+    return play_by_play_with_players.process_batch(game_ids, season)
+
+def fetch_shot_details(combos, season, season_type):
+    return _per_item(combos, lambda combo: shot_details.fetch_player_shot_chart(combo[1], combo[2], season, season_type))
+
+
+STAGES = [
+    Stage(Tables.TEAM_GAME_LOG, fetch_team_game_log, writer_batch_size=1, unit='seasons'),
+    Stage(Tables.PLAY_BY_PLAY, fetch_play_by_play, depends_on=(Tables.TEAM_GAME_LOG,), workers=8),
+    Stage(Tables.ROTATIONS, fetch_rotations, depends_on=(Tables.TEAM_GAME_LOG,), workers=8),
+    Stage(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD, fetch_players_on_court, depends_on=(Tables.PLAY_BY_PLAY,),
+          workers=4),
+    # CPU bound, so on processes; batches of games are loaded with one query per input table
+    Stage(Tables.PLAY_BY_PLAY_WITH_PLAYERS, process_play_by_play_with_players,
+          depends_on=(Tables.TEAM_GAME_LOG, Tables.PLAY_BY_PLAY, Tables.ROTATIONS),
+          after=(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD,),
+          workers=2, executor=PROCESS, batch_size=play_by_play_with_players.BATCH_SIZE,
+          writer_batch_size=play_by_play_with_players.BATCH_SIZE),
+    Stage(Tables.SHOT_DETAILS, fetch_shot_details, depends_on=(Tables.ROTATIONS,), workers=8,
+          unit='player-team combos'),
+]
+
+
+class Pipeline:
+    """
+    Schedules the stages' tasks and writes from one thread. Finished tasks and written batches are reported back on
+    a queue by the workers and the writer threads; the scheduler hands frames to the stage's WriteBehindWriter and,
+    once a game's frame is committed, starts every stage whose inputs for that game have all landed.
+
+    With delta, a game's stage that the ingestion manifest has as complete is skipped and counts as landed.
+    Games that fail a stage are recorded as failed in the manifest and don't go on to the stages that depend on it.
+    """
+
+    def __init__(self, stages, season_type, delta=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.season_type = season_type
+        self.delta = delta
+        self.events = queue.Queue()
+        self.stats = {name: StageStats() for name in self.order}
+        self.workers = {}
+        self.writers = {}
+        # Per stage: items waiting for a worker, items ever scheduled (ready, running, written or failed), landed and
+        # failed items
+        self.ready = {name: [] for name in self.order}
+        self.scheduled = {name: set() for name in self.order}
+        self.landed = {name: set() for name in self.order}
+        self.failed = {name: set() for name in self.order}
+        self.running = {name: 0 for name in self.order}
+        # Item of every frame handed to a writer and not yet written, by id(frame)
+        self.writing = {}
+        self.seasons = {}
+
+    def start(self):
+        # Process pools are forked before any other thread of the pipeline is started
+        for name in sorted(self.order, key=lambda n: self.stages[n].executor != PROCESS):
+            stage = self.stages[name]
+            self.workers[name] = Workers(stage.workers, stage.executor).start()
+        for name in self.order:
+            stage = self.stages[name]
+            after_write = None if name == Tables.TEAM_GAME_LOG else ingestion_manifest.recorder(name)
+            self.writers[name] = WriteBehindWriter(
+                database_client, name, batch_size=stage.writer_batch_size, raise_errors=False, unit=stage.unit,
+                after_write=after_write, flush_after=FLUSH_AFTER,
+                after_batch=lambda batch, error, name=name: self.events.put(('written', name, batch, error)))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close(raise_errors=False)
+        for workers in self.workers.values():
+            workers.close()
+
+    def run(self, seasons):
+        self.start()
+        try:
+            for season in seasons:
+                self._add(Tables.TEAM_GAME_LOG, season, season)
+            self._submit_ready()
+            while self._busy():
+                self._handle(*self.events.get())
+                self._submit_ready()
+        finally:
+            self.close()
+        self.report()
+
+    def _busy(self):
+        return bool(self.writing) or any(self.running.values()) or any(self.ready.values())
+
+    def _add(self, name, item, season):
+        if item in self.scheduled[name]:
+            return
+        self.scheduled[name].add(item)
+        self.seasons.setdefault((name, item), season)
+        self.ready[name].append(item)
+
+    def _submit_ready(self):
+        for name in self.order:
+            stage = self.stages[name]
+            while self.ready[name] and self.running[name] < stage.workers:
+                # A task's items share the season of its first item
+                season = self.seasons[(name, self.ready[name][0])]
+                items = [item for item in self.ready[name] if self.seasons[(name, item)] == season][:stage.batch_size]
+                self.ready[name] = [item for item in self.ready[name] if item not in items]
+                self.running[name] += 1
+                if self.stats[name].first_start is None:
+                    self.stats[name].first_start = time.monotonic()
+                future = self.workers[name].submit(stage.fn, items, season, self.season_type)
+                started = time.monotonic()
+                future.add_done_callback(
+                    lambda f, name=name, items=items, started=started: self.events.put(('done', name, items, f, started)))
+
+    def _handle(self, kind, name, *payload):
+        if kind == 'done':
+            items, future, started = payload
+            self.running[name] -= 1
+            self.stats[name].busy += time.monotonic() - started
+            error = future.exception()
+            results = future.result() if error is None else [(item, None, str(error)) for item in items]
+            for item, frame, failure in results:
+                if failure is not None:
+                    self._fail(name, item, failure)
+                elif frame is None or frame.empty:
+                    self._land(name, item, None)
+                else:
+                    self.writing[id(frame)] = item
+                    # Blocks while the stage's writer is max_pending frames behind
+                    self.writers[name].put(frame)
+        else:
+            batch, error = payload
+            for frame in batch:
+                item = self.writing.pop(id(frame))
+                if error is not None:
+                    self._fail(name, item, error)
+                else:
+                    self._land(name, item, frame)
+
+    def _fail(self, name, item, error):
+        print(f"{name} failed for {item}: {error}")
+        self.stats[name].failed += 1
+        self.failed[name].add(item)
+        if name == Tables.TEAM_GAME_LOG:
+            return
+        season = self.seasons[(name, item)]
+        if name == Tables.SHOT_DETAILS:
+            item_id = shot_details.combo_item_id({Columns.PLAYER_ID: item[1], Columns.TEAM_ID: item[2]})
+            ingestion_manifest.mark_failed(name, season, self.season_type, item_id, error)
+            return
+        ingestion_manifest.mark_failed(name, season, self.season_type, item, error)
+        # Stages that only run after this one can go ahead without it
+        self._schedule_game(item, season)
+
+    def _land(self, name, item, frame):
+        stats = self.stats[name]
+        stats.landed += 1
+        stats.last_landed = time.monotonic()
+        self.landed[name].add(item)
+        season = self.seasons[(name, item)]
+        if name == Tables.TEAM_GAME_LOG:
+            game_ids = [] if frame is None else sorted(frame[Columns.GAME_ID].unique())
+            self._add_season_games(season, game_ids)
+            return
+        if name == Tables.ROTATIONS and frame is not None:
+            for player_id, team_id in frame[[Columns.PLAYER_ID, Columns.TEAM_ID]].drop_duplicates().itertuples(index=False):
+                # A combo's shot chart covers its whole season, so it is fetched once per season of the run
+                self._add(Tables.SHOT_DETAILS, (season, int(player_id), int(team_id)), season)
+        self._schedule_game(item, season)
+
+    def _add_season_games(self, season, game_ids):
+        print(f"{len(game_ids)} games in {season} {self.season_type}")
+        # The season's team_game_log rows are written, so they have landed for every game of the season
+        self.landed[Tables.TEAM_GAME_LOG] |= set(game_ids)
+        for name in self.order:
+            if name in (Tables.TEAM_GAME_LOG, Tables.SHOT_DETAILS):
+                continue
+            for gid in game_ids:
+                self.seasons[(name, gid)] = season
+            if self.delta:
+                completed = ingestion_manifest.completed(name, season, self.season_type) & set(game_ids)
+                self.stats[name].skipped += len(completed)
+                self.landed[name] |= completed
+                self.scheduled[name] |= completed
+        for gid in game_ids:
+            self._schedule_game(gid, season)
+
+    def _schedule_game(self, gid, season):
+        # Starts every game stage whose inputs for gid have all landed, and whose optional inputs landed or failed
+        for name in self.order:
+            stage = self.stages[name]
+            if name == Tables.SHOT_DETAILS or not stage.depends_on or gid in self.scheduled[name]:
+                continue
+            if all(gid in self.landed[dep] for dep in stage.depends_on) and \
+                    all(gid in self.landed[dep] or gid in self.failed[dep] for dep in stage.after):
+                self._add(name, gid, season)
+
+    def report(self):
+        print(f"{'Stage':>36} {'Landed':>8} {'Skipped':>8} {'Failed':>8} {'Busy s':>9} {'Items/s':>9}")
+        for name in self.order:
+            stats = self.stats[name]
+            print(f"{name:>36} {stats.landed:>8} {stats.skipped:>8} {stats.failed:>8} {stats.busy:>9.1f} "
+                  f"{stats.throughput():>9.2f}")
+
+
+def configure_stage_workers(stages, value):
+    if not value:
+        return
+    by_name = {stage.name: stage for stage in stages}
+    for pair in value.split(','):
+        name, _, workers = pair.partition('=')
+        if name.strip() not in by_name:
+            raise Exception(f"Unknown stage {name}, must be one of {list(by_name)}")
+        by_name[name.strip()].workers = int(workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run every ETL stage for the games of given seasons and season type.')
+    season_arg(parser)
+    season_type_arg(parser)
+    delta_arg(parser)
+    stage_workers_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
+    args = parser.parse_args()
+    if not args.season or not args.season_type:
+        raise Exception("You must provide both --season and --season_type.")
+    configure_stage_workers(STAGES, args.stage_workers)
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
+
+    seasons = [s.strip() for s in args.season.split(',') if s.strip()]
+    Pipeline(STAGES, args.season_type, delta=args.delta).run(seasons)
+    database_client.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,27 @@
 import argparse
-import pandas as pd
 
 from api.smart import smart
+from api.async_smart import AsyncSmart
 from database.db_client import database_client
 from database.db_constants import Tables, Columns
+from database.manifest import ingestion_manifest
+from database.write_behind import WriteBehindWriter
 from utils.arg_parser import (
     season_arg,
     season_type_arg,
     game_id_arg,
     delta_arg,
+    cache_arg,
+    rate_limit_arg,
+    hedge_arg,
+    metrics_arg,
+    stand_in_arg,
+    concurrency_arg,
 )
 from utils.utils import (
     extract_season_from_game_id,
     extract_season_type_from_game_id,
     add_season_and_type,
-    add_id,
     fill_nulls,
 )
 
@@ -22,13 +29,40 @@ def fetch_play_by_play_by_game_id(game_id):
     """
     Fetch play-by-play DataFrame for a single game_id, with SEASON and SEASON_TYPE columns added.
     """
-    df = smart.play_by_play(game_id)
+    return build_play_by_play_frame(game_id, smart.play_by_play(game_id))
+
+async def fetch_play_by_play_by_game_id_async(async_smart, game_id):
+    """
+    Async version of fetch_play_by_play_by_game_id.
+    """
+    return build_play_by_play_frame(game_id, await async_smart.play_by_play(game_id))
+
+def fetch_play_by_play_games(game_ids, concurrency=1):
+    """
+    Yields (game_id, DataFrame) for each game_id in order, or (game_id, exception) if the fetch failed.
+    With concurrency > 1 games are fetched concurrently through AsyncSmart.
+    """
+    if concurrency > 1:
+        async_smart = AsyncSmart(smart, concurrency=concurrency)
+        try:
+            yield from async_smart.iter_results(fetch_play_by_play_by_game_id_async, game_ids)
+        finally:
+            async_smart.close()
+        return
+    for gid in game_ids:
+        try:
+            yield gid, fetch_play_by_play_by_game_id(gid)
+        except Exception as e:
+            yield gid, e
+
+def build_play_by_play_frame(game_id, df):
+    """
+    Adds SEASON, SEASON_TYPE and GAME_ID columns to a raw play-by-play DataFrame.
+    """
     season = extract_season_from_game_id(game_id)
     season_type = extract_season_type_from_game_id(game_id)
     df = add_season_and_type(df, season, season_type)
     df[Columns.GAME_ID] = game_id  # Add game_id column for traceability
-    # Add 'id' column using GAME_ID and EVENTNUM (always present)
-    df = add_id(df, [Columns.GAME_ID, Columns.EVENTNUM])
     # Fill NaN/nulls
     df = fill_nulls(df)
     df = df.drop_duplicates()
@@ -37,29 +71,20 @@ def fetch_play_by_play_by_game_id(game_id):
 
 def play_by_play_exists(game_id):
     """
-    Returns True if the play-by-play data for the given game_id already exists in the play_by_play table.
+    Returns True if the ingestion manifest has the play-by-play for the given game_id as complete.
     """
-    check_query = f'''
-        SELECT 1 FROM {Tables.PLAY_BY_PLAY}
-        WHERE "{Columns.GAME_ID}" = :game_id
-        LIMIT 1
-    '''
-    exists = database_client.read(check_query, params={'game_id': game_id})
-    return exists is not None and not exists.empty
+    season = extract_season_from_game_id(game_id)
+    season_type = extract_season_type_from_game_id(game_id)
+    return game_id in ingestion_manifest.completed(Tables.PLAY_BY_PLAY, season, season_type)
 
 def get_existing_play_by_play_game_ids(seasons, season_type):
     """
-    Returns a set of all game_ids that already exist in the play_by_play table for the given seasons and season_type.
+    Returns a set of all game_ids the ingestion manifest has as complete in play_by_play for the given seasons and season_type.
     """
-    delta_query = f'''
-        SELECT DISTINCT "{Columns.GAME_ID}"
-        FROM {Tables.PLAY_BY_PLAY}
-        WHERE "{Columns.SEASON}" IN :seasons AND "{Columns.SEASON_TYPE}" = :season_type
-    '''
-    existing = database_client.read(delta_query, params={'seasons': tuple(seasons), 'season_type': season_type})
-    if existing is not None and not existing.empty:
-        return set(existing[Columns.GAME_ID].tolist())
-    return set()
+    existing = set()
+    for season in seasons:
+        existing |= ingestion_manifest.completed(Tables.PLAY_BY_PLAY, season, season_type)
+    return existing
 
 
 def main():
@@ -68,7 +93,18 @@ def main():
     season_type_arg(parser)
     game_id_arg(parser)
     delta_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
+    concurrency_arg(parser)
     args = parser.parse_args()
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
 
     # Argument validation: must provide only one mode
     has_game_id = args.game_id is not None
@@ -88,7 +124,7 @@ def main():
                 print(f"Play-by-play data already exists for game_id {args.game_id}. Skipping.")
                 return
         df = fetch_play_by_play_by_game_id(args.game_id)
-        database_client.write(df, Tables.PLAY_BY_PLAY)
+        database_client.write(df, Tables.PLAY_BY_PLAY, after_write=ingestion_manifest.recorder(Tables.PLAY_BY_PLAY))
         print(f"Wrote play-by-play for game_id {args.game_id} to table {Tables.PLAY_BY_PLAY}")
         return
 
@@ -113,35 +149,19 @@ def main():
                 print(f"Delta mode: {len(existing_game_ids)} games already exist in play_by_play, {len(game_ids)} remaining to fetch.")
             else:
                 print(f"Delta mode: No games found in play_by_play for these seasons and type.")
-        dfs = []
-        written_games = 0
-        for i, gid in enumerate(game_ids, 1):
-            try:
-                df = fetch_play_by_play_by_game_id(gid)
-                dfs.append(df)
-            except Exception as e:
-                print(f"Failed to fetch play-by-play for game_id {gid}: {e}")
-            # Every 10 games, write to DB and clear dfs
-            if i%10 == 0:
-                try:
-                    all_df = pd.concat(dfs)
-                    database_client.write(all_df, Tables.PLAY_BY_PLAY)
-                    written_games = i
-                    print(f"Wrote play-by-play for {written_games} of {len(game_ids)} games to table {Tables.PLAY_BY_PLAY}")
-                    dfs = []
-                except Exception as e:
-                    print(f"Failed to write play-by-play for {i} games: {' '.join(all_df[Columns.GAME_ID].unique())}")
-                    print(f"Error: {e}")
-                    # Clear dfs to avoid memory issues
-                    dfs = []
-        # Write any remaining DataFrames
-        if dfs:
-            all_df = pd.concat(dfs)
-            database_client.write(all_df, Tables.PLAY_BY_PLAY)
-            written_games += len(dfs)
-            print(f"Wrote play-by-play for {written_games} of {len(game_ids)} games to table {Tables.PLAY_BY_PLAY}")
-        if written_games == 0:
-            print("No play-by-play data fetched.")
+        # Batches are written every 10 games on a background thread while the next games are fetched.
+        # A failed batch is reported and skipped.
+        with WriteBehindWriter(database_client, Tables.PLAY_BY_PLAY, total=len(game_ids), raise_errors=False,
+                               after_write=ingestion_manifest.recorder(Tables.PLAY_BY_PLAY)) as writer:
+            for gid, df in fetch_play_by_play_games(game_ids, args.concurrency):
+                if isinstance(df, Exception):
+                    print(f"Failed to fetch play-by-play for game_id {gid}: {df}")
+                    ingestion_manifest.mark_failed(Tables.PLAY_BY_PLAY, extract_season_from_game_id(gid),
+                                                   args.season_type, gid, df)
+                else:
+                    writer.put(df)
+        if writer.written == 0:
+            print("No play-by-play data written.")
         return
 
 if __name__ == "__main__":
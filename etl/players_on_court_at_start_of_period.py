@@ -1,36 +1,22 @@
 import argparse
+import os
+import tempfile
 import pandas as pd
 from api.smart import smart
 from database.db_client import database_client
 from database.db_constants import Tables, Columns
-from utils.arg_parser import season_arg, season_type_arg, game_id_arg, delta_arg
-from utils.utils import add_season_and_type, add_id, fill_nulls,extract_season_from_game_id, extract_season_type_from_game_id
+from database.manifest import ingestion_manifest
+from database.write_behind import WriteBehindWriter
+from utils.arg_parser import season_arg, season_type_arg, game_id_arg, delta_arg, cache_arg, rate_limit_arg, hedge_arg, metrics_arg, stand_in_arg, workers_arg
+from utils.utils import add_season_and_type, fill_nulls,extract_season_from_game_id, extract_season_type_from_game_id
+from utils.clock import get_period_time_bounds, seconds_from_start
+from utils.workers import Workers, PROCESS
 
 """
 NOTE: This script turned out to be unnecessary. A rotations api exists that provides the players on court at the start of each period.
 """
 
 # --- Helper Functions ---
-def convert_time_to_seconds(period, time_str):
-    # Converts 'MM:SS' to seconds from game start for a given period
-    minutes, seconds = map(int, time_str.split(':'))
-    if period <= 4:
-        return (period - 1) * 12 * 60 + (12 * 60 - (minutes * 60 + seconds))
-    else:
-        return 4 * 12 * 60 + (period - 5) * 5 * 60 + (5 * 60 - (minutes * 60 + seconds))
-
-def get_period_time_bounds(period):
-    # Returns (start_time, end_time) in tenths of a second for a given period
-    if period <= 4:
-        # Each regulation period is 12 minutes
-        period_start = (period - 1) * 12 * 60
-        period_end = period_start + 12 * 60
-    else:
-        # Overtime periods are 5 minutes
-        period_start = 4 * 12 * 60 + (period - 5) * 5 * 60
-        period_end = period_start + 5 * 60 
-    return period_start * 10, period_end * 10  # Convert to tenths of seconds
-
 def fetch_play_by_play(game_id):
     # Read play-by-play from the database, not the API
     query = f'SELECT * FROM {Tables.PLAY_BY_PLAY} WHERE "{Columns.GAME_ID}" = :game_id'
@@ -61,8 +47,7 @@ def extract_subs(pbp):
     subs = pbp[pbp[Columns.EVENTMSGTYPE] == 8].copy()
     subs[Columns.PERIOD] = subs[Columns.PERIOD].astype(int)
     if not subs.empty:
-        subs[Columns.SECONDS_FROM_START] = subs.apply(
-            lambda row: convert_time_to_seconds(row[Columns.PERIOD], row[Columns.PCTIMESTRING]), axis=1)
+        subs[Columns.SECONDS_FROM_START] = seconds_from_start(subs[Columns.PERIOD], subs[Columns.PCTIMESTRING])
         # Sort by SECONDS_FROM_START ascending, then EVENTNUM ascending
         subs = subs.sort_values([Columns.PERIOD, Columns.SECONDS_FROM_START, Columns.EVENTNUM], ascending=[True,True, True])
     else:
@@ -166,20 +151,9 @@ def process_game(game_id, season, season_type):
 
 def filter_game_ids_delta(game_ids, season, season_type):
     """
-    Given a list of game_ids, remove those already present in the output table for the given season and season_type.
+    Given a list of game_ids, remove those the ingestion manifest has as complete for the given season and season_type.
     """
-    q_delta = f'SELECT DISTINCT "{Columns.GAME_ID}" FROM {Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD} WHERE "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :stype'
-    result_delta = database_client.read(q_delta, params={'season': season, 'stype': season_type})
-    if result_delta is not None and not result_delta.empty:
-        existing_game_ids = set(result_delta[Columns.GAME_ID].tolist())
-        before_count = len(game_ids)
-        filtered_game_ids = [gid for gid in game_ids if gid not in existing_game_ids]
-        after_count = len(filtered_game_ids)
-        print(f"Delta mode: {before_count - after_count} games already exist in {Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD}, {after_count} remaining to process for season {season}.")
-        return filtered_game_ids
-    else:
-        print(f"Delta mode: No games found in {Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD} for season {season} and type {season_type}.")
-        return game_ids
+    return ingestion_manifest.filter_delta(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD, season, season_type, game_ids)
 
 def get_game_ids(season, season_type):
     q = f'SELECT DISTINCT "{Columns.GAME_ID}" FROM {Tables.TEAM_GAME_LOG} WHERE "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :stype'
@@ -187,20 +161,30 @@ def get_game_ids(season, season_type):
     game_ids = result[Columns.GAME_ID].tolist()
     return game_ids
 
-def write_frames(dfs, games_to_process, i, season, season_type):
-    all_df = pd.concat(dfs)
-    all_df = add_season_and_type(all_df, season, season_type)
-    all_df = add_id(all_df, [Columns.GAME_ID, Columns.PERIOD, Columns.PLAYER_ID])
-    database_client.write(all_df, Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD)
-    print(f"Wrote {i}/{games_to_process} games to {Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD}")
-
 def main():
     parser = argparse.ArgumentParser(description='Determine players on court at start of each period for NBA games.')
     season_arg(parser)
     season_type_arg(parser)
     game_id_arg(parser)
     delta_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
+    workers_arg(parser)
     args = parser.parse_args()
+    rate_limit_dir = None
+    if args.executor == PROCESS and args.rate_limit_file is None:
+        # Forked workers would each get a copy of the rate limiter, so the API would see workers times the rate.
+        # They share one budget through a state file instead.
+        rate_limit_dir = tempfile.TemporaryDirectory()
+        args.rate_limit_file = os.path.join(rate_limit_dir.name, 'rate_limit.json')
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
 
     # Enforce: only one of (game_id) or (season and season_type) can be provided
     has_game_id = args.game_id is not None
@@ -215,7 +199,8 @@ def main():
         season_in = extract_season_from_game_id(args.game_id)
         season_type = extract_season_type_from_game_id(args.game_id)
         df = process_game(args.game_id, season_in, season_type)
-        database_client.write(df, Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD)
+        database_client.write(df, Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD,
+                              after_write=ingestion_manifest.recorder(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD))
         print(f"Processed game {args.game_id}")
     else:
         seasons = [s.strip() for s in args.season.split(',') if s.strip()]
@@ -228,26 +213,26 @@ def main():
             if getattr(args, 'delta', False):
                 game_ids = filter_game_ids_delta(game_ids, season, season_type)
 
-            dfs = []
-            games_to_process = len(game_ids)
-            for i, gid in enumerate(game_ids, 1):
-                print(f"Processing game {gid}")
-
-                try:
-                    df = process_game(gid, season, args.season_type)
-                    dfs.append(df)
+            def prepare(all_df, season=season):
+                return add_season_and_type(all_df, season, season_type)
+
+            recorder = ingestion_manifest.recorder(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD)
+            tasks = [(gid, season, season_type) for gid in game_ids]
+            # Workers are started first so they are not forked while the writer thread runs
+            with Workers(args.workers, args.executor) as workers, \
+                    WriteBehindWriter(database_client, Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD,
+                                      total=len(game_ids), prepare=prepare, after_write=recorder) as writer:
+                for (gid, _, _), df, e in workers.map(process_game, tasks):
+                    if e is not None:
+                        print(f"Failed for game {gid}: {e}")
+                        ingestion_manifest.mark_failed(Tables.PLAYERS_ON_COURT_AT_START_OF_PERIOD, season, season_type,
+                                                       gid, e)
+                        continue
                     print(f"Processed game {gid}")
-                except Exception as e:
-                    print(f"Failed for game {gid}: {e}")
-                # Write to DB every 10 games
-                if i%10 == 0:
-                    
-                    write_frames(dfs, games_to_process, i, season, season_type)
-                    dfs = []
-            # Write any remaining games
-            if dfs:
-                write_frames(dfs, games_to_process, i, season, season_type)
+                    writer.put(df)
     database_client.close()
+    if rate_limit_dir is not None:
+        rate_limit_dir.cleanup()
 
 if __name__ == '__main__':
     main()
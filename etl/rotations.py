@@ -1,10 +1,13 @@
 import argparse
 import pandas as pd
 from api.smart import smart
+from api.async_smart import AsyncSmart
 from database.db_client import database_client
 from database.db_constants import Tables, Columns
-from utils.arg_parser import season_arg, season_type_arg, game_id_arg, delta_arg
-from utils.utils import add_id, fill_nulls, extract_season_from_game_id, extract_season_type_from_game_id
+from database.manifest import ingestion_manifest
+from database.write_behind import WriteBehindWriter
+from utils.arg_parser import season_arg, season_type_arg, game_id_arg, delta_arg, cache_arg, rate_limit_arg, hedge_arg, metrics_arg, stand_in_arg, concurrency_arg
+from utils.utils import fill_nulls, extract_season_from_game_id, extract_season_type_from_game_id
 import json
 
 def agg_stints(grp):
@@ -15,7 +18,29 @@ def agg_stints(grp):
 
 def fetch_rotation(game_id, season, season_type):
     # Fetch rotation data from NBA API
-    data = smart.game_rotation(game_id)
+    return build_rotation_frame(game_id, season, season_type, smart.game_rotation(game_id))
+
+async def fetch_rotation_async(async_smart, game_id, season, season_type):
+    return build_rotation_frame(game_id, season, season_type, await async_smart.game_rotation(game_id))
+
+def fetch_rotations(game_ids, season, season_type, concurrency=1):
+    # Yields (game_id, DataFrame or None) in order, or (game_id, exception) if the fetch failed
+    if concurrency > 1:
+        async def fetch(async_smart, gid):
+            return await fetch_rotation_async(async_smart, gid, season, season_type)
+        async_smart = AsyncSmart(smart, concurrency=concurrency)
+        try:
+            yield from async_smart.iter_results(fetch, game_ids)
+        finally:
+            async_smart.close()
+        return
+    for gid in game_ids:
+        try:
+            yield gid, fetch_rotation(gid, season, season_type)
+        except Exception as e:
+            yield gid, e
+
+def build_rotation_frame(game_id, season, season_type, data):
     home_df = data['HomeTeam']
     away_df = data['AwayTeam']
 
@@ -61,25 +86,12 @@ def fetch_rotation(game_id, season, season_type):
     ]
 
     result = df.groupby(group_cols)[[Columns.IN_TIME_REAL, Columns.OUT_TIME_REAL]].apply(agg_stints).reset_index()
-    # Add id
-    result = add_id(result, [Columns.GAME_ID, Columns.PLAYER_ID])
     # Fill nulls
     result = fill_nulls(result)
     return result
 
-def filter_game_ids_delta(db, game_ids, season, season_type):
-    q_delta = f'SELECT DISTINCT "{Columns.GAME_ID}" FROM {Tables.ROTATIONS} WHERE "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :stype'
-    result_delta = db.read(q_delta, params={'season': season, 'stype': season_type})
-    if result_delta is not None and not result_delta.empty:
-        existing_game_ids = set(result_delta[Columns.GAME_ID].tolist())
-        before_count = len(game_ids)
-        filtered_game_ids = [gid for gid in game_ids if gid not in existing_game_ids]
-        after_count = len(filtered_game_ids)
-        print(f"Delta mode: {before_count - after_count} games already exist in rotations, {after_count} remaining to process for season {season}.")
-        return filtered_game_ids
-    else:
-        print(f"Delta mode: No games found in rotations for season {season} and type {season_type}.")
-        return game_ids
+def filter_game_ids_delta(game_ids, season, season_type):
+    return ingestion_manifest.filter_delta(Tables.ROTATIONS, season, season_type, game_ids)
 
 def get_game_ids(season, season_type, db):
     q = f'SELECT DISTINCT "{Columns.GAME_ID}" FROM {Tables.TEAM_GAME_LOG} WHERE "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :stype'
@@ -87,18 +99,24 @@ def get_game_ids(season, season_type, db):
     game_ids = result[Columns.GAME_ID].tolist()
     return game_ids
 
-def write_frames(dfs, db, games_to_process, i):
-    all_df = pd.concat(dfs)
-    db.write(all_df, Tables.ROTATIONS)
-    print(f"Wrote {i}/{games_to_process} games to {Tables.ROTATIONS}")
-
 def main():
     parser = argparse.ArgumentParser(description='Pull NBA rotations for given seasons and season type.')
     season_arg(parser)
     season_type_arg(parser)
     game_id_arg(parser)
     delta_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
+    concurrency_arg(parser)
     args = parser.parse_args()
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
 
     has_game_id = args.game_id is not None
     has_season_and_type = args.season is not None and args.season_type is not None
@@ -115,31 +133,26 @@ def main():
         if df is None or df.empty:
             print(f"No rotation data found for game {args.game_id}.")
             return
-        database_client.write(df, Tables.ROTATIONS)
+        database_client.write(df, Tables.ROTATIONS, after_write=ingestion_manifest.recorder(Tables.ROTATIONS))
         print(f"Processed game {args.game_id}")
     else:
         seasons = [s.strip() for s in args.season.split(',') if s.strip()]
         for season in seasons:
             game_ids = get_game_ids(season, args.season_type, database_client)
             if getattr(args, 'delta', False):
-                game_ids = filter_game_ids_delta(database_client, game_ids, season, args.season_type)
-            dfs = []
-            games_to_process = len(game_ids)
-            for i, gid in enumerate(game_ids, 1):
-                try:
-                    df = fetch_rotation(gid, season, args.season_type)
-                    if df is None or df.empty:
-                        print(f"No rotation data found for game {args.game_id}.")
+                game_ids = filter_game_ids_delta(game_ids, season, args.season_type)
+            with WriteBehindWriter(database_client, Tables.ROTATIONS, total=len(game_ids),
+                                   after_write=ingestion_manifest.recorder(Tables.ROTATIONS)) as writer:
+                for gid, df in fetch_rotations(game_ids, season, args.season_type, args.concurrency):
+                    if isinstance(df, Exception):
+                        print(f"Failed for game {gid}: {df}")
+                        ingestion_manifest.mark_failed(Tables.ROTATIONS, season, args.season_type, gid, df)
                     else:
-                        dfs.append(df)
-                    print(f"Processed game {gid}")
-                except Exception as e:
-                    print(f"Failed for game {gid}: {e}")
-                if i%10 == 0 and len(dfs) > 0:
-                    write_frames(dfs, database_client, games_to_process, i)
-                    dfs = []
-            if dfs:
-                write_frames(dfs, database_client, games_to_process, i)
+                        if df is None or df.empty:
+                            print(f"No rotation data found for game {gid}.")
+                        else:
+                            writer.put(df)
+                        print(f"Processed game {gid}")
     database_client.close()
 
 if __name__ == '__main__':
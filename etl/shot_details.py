@@ -1,26 +1,47 @@
 import argparse
-import pandas as pd
 import json
 from api.smart import smart
+from api.async_smart import AsyncSmart
 from database.db_client import database_client
 from database.db_constants import Tables, Columns
-from utils.arg_parser import season_arg, season_type_arg, player_id_arg, delta_arg
-from utils.utils import add_id, fill_nulls
+from database.manifest import ingestion_manifest, item_id
+from database.write_behind import WriteBehindWriter
+from utils.arg_parser import season_arg, season_type_arg, player_id_arg, delta_arg, cache_arg, rate_limit_arg, hedge_arg, metrics_arg, stand_in_arg, concurrency_arg
+from utils.utils import fill_nulls
 
 def fetch_player_shot_chart(player_id, team_id, season, season_type):
     # Fetch shot chart data for a player/season/team
     df = smart.get_shot_chart_detail(player_id=player_id, team_id=team_id, season=season, season_type=season_type)
+    return build_shot_chart_frame(df, player_id, team_id, season, season_type)
+
+async def fetch_player_shot_chart_async(async_smart, combo):
+    df = await async_smart.get_shot_chart_detail(player_id=combo[Columns.PLAYER_ID], team_id=combo[Columns.TEAM_ID],
+                                                 season=combo[Columns.SEASON], season_type=combo[Columns.SEASON_TYPE])
+    return build_shot_chart_frame(df, combo[Columns.PLAYER_ID], combo[Columns.TEAM_ID], combo[Columns.SEASON],
+                                  combo[Columns.SEASON_TYPE])
+
+def fetch_shot_charts(combos, concurrency=1):
+    # Yields (combo, DataFrame or None) in order, or (combo, exception) if the fetch failed
+    if concurrency > 1:
+        async_smart = AsyncSmart(smart, concurrency=concurrency)
+        try:
+            yield from async_smart.iter_results(fetch_player_shot_chart_async, combos)
+        finally:
+            async_smart.close()
+        return
+    for combo in combos:
+        try:
+            yield combo, fetch_player_shot_chart(combo[Columns.PLAYER_ID], combo[Columns.TEAM_ID], combo[Columns.SEASON], combo[Columns.SEASON_TYPE])
+        except Exception as e:
+            yield combo, e
+
+def build_shot_chart_frame(df, player_id, team_id, season, season_type):
     if df is None or df.empty:
         return None
     df[Columns.PLAYER_ID] = player_id
     df[Columns.TEAM_ID] = team_id
     df[Columns.SEASON] = season
     df[Columns.SEASON_TYPE] = season_type
-    # Add id column (PLAYER_ID, GAME_ID, GAME_EVENT_ID)
-    if Columns.GAME_ID in df.columns and 'GAME_EVENT_ID' in df.columns:
-        df = add_id(df, [Columns.PLAYER_ID, Columns.GAME_ID, 'GAME_EVENT_ID'])
-    else:
-        df = add_id(df, [Columns.PLAYER_ID, Columns.TEAM_ID, Columns.SEASON, Columns.SEASON_TYPE])
     df = fill_nulls(df)
     df = df.drop_duplicates()
     return df
@@ -37,23 +58,16 @@ def get_player_team_combos(season, season_type, player_id=None):
         return []
     return result[[Columns.PLAYER_ID, Columns.TEAM_ID, Columns.SEASON, Columns.SEASON_TYPE]].drop_duplicates().to_dict('records')
 
+def combo_item_id(combo):
+    return item_id(combo[Columns.PLAYER_ID], combo[Columns.TEAM_ID])
+
 def filter_combos_delta(season, season_type, combos):
-    # Remove combos already present in shot_details table
+    # Remove combos the ingestion manifest has as complete in shot_details
     if not combos:
         return []
-    q = f'SELECT DISTINCT "{Columns.PLAYER_ID}", "{Columns.TEAM_ID}", "{Columns.SEASON}", "{Columns.SEASON_TYPE}" FROM shot_details WHERE "{Columns.SEASON}" = :season AND "{Columns.SEASON_TYPE}" = :stype'
-    result = database_client.read(q, params={'season': season, 'stype': season_type})
-    if result is None or result.empty:
-        return combos
-    existing = set(tuple(x) for x in result[[Columns.PLAYER_ID, Columns.TEAM_ID, Columns.SEASON, Columns.SEASON_TYPE]].values.tolist())
-    filtered = [c for c in combos if (c[Columns.PLAYER_ID], c[Columns.TEAM_ID], c[Columns.SEASON], c[Columns.SEASON_TYPE]) not in existing]
-    print(f"Delta mode: {len(combos) - len(filtered)} combos already exist in shot_details, {len(filtered)} remaining to process for season {season}.")
-    return filtered
-
-def write_frames(dfs, db, total, i):
-    all_df = pd.concat(dfs)
-    db.write(all_df, 'shot_details')
-    print(f"Wrote {i}/{total} player-team combos to shot_details")
+    remaining = set(ingestion_manifest.filter_delta(Tables.SHOT_DETAILS, season, season_type,
+                                                    [combo_item_id(c) for c in combos]))
+    return [c for c in combos if combo_item_id(c) in remaining]
 
 def main():
     parser = argparse.ArgumentParser(description='Pull NBA shot chart details for given players/seasons and season type.')
@@ -61,7 +75,18 @@ def main():
     season_type_arg(parser)
     player_id_arg(parser)
     delta_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
+    concurrency_arg(parser)
     args = parser.parse_args()
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
 
     if not args.season or not args.season_type:
         raise Exception("You must provide both --season and --season_type.")
@@ -71,21 +96,16 @@ def main():
         combos = get_player_team_combos(season, args.season_type, getattr(args, 'player_id', None))
         if getattr(args, 'delta', False):
             combos = filter_combos_delta(season, args.season_type, combos)
-        dfs = []
-        total = len(combos)
-        for i, combo in enumerate(combos, 1):
-            try:
-                df = fetch_player_shot_chart(combo[Columns.PLAYER_ID], combo[Columns.TEAM_ID], combo[Columns.SEASON], combo[Columns.SEASON_TYPE])
-                if df is not None and not df.empty:
-                    dfs.append(df)
-                print(f"Processed player {combo[Columns.PLAYER_ID]} team {combo[Columns.TEAM_ID]} season {combo[Columns.SEASON]}")
-            except Exception as e:
-                print(f"Failed for player {combo[Columns.PLAYER_ID]} team {combo[Columns.TEAM_ID]}: {e}")
-            if i % 10 == 0 and dfs:
-                write_frames(dfs, database_client, total, i)
-                dfs = []
-        if dfs:
-            write_frames(dfs, database_client, total, i)
+        with WriteBehindWriter(database_client, Tables.SHOT_DETAILS, total=len(combos), unit='player-team combos',
+                               after_write=ingestion_manifest.recorder(Tables.SHOT_DETAILS)) as writer:
+            for combo, df in fetch_shot_charts(combos, args.concurrency):
+                if isinstance(df, Exception):
+                    print(f"Failed for player {combo[Columns.PLAYER_ID]} team {combo[Columns.TEAM_ID]}: {df}")
+                    ingestion_manifest.mark_failed(Tables.SHOT_DETAILS, season, args.season_type, combo_item_id(combo), df)
+                else:
+                    if df is not None and not df.empty:
+                        writer.put(df)
+                    print(f"Processed player {combo[Columns.PLAYER_ID]} team {combo[Columns.TEAM_ID]} season {combo[Columns.SEASON]}")
     database_client.close()
 
 if __name__ == '__main__':
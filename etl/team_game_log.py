@@ -1,19 +1,29 @@
 import argparse
 from api.smart import smart
 from database.db_client import database_client
-from utils.utils import add_id, add_season_and_type, fill_nulls
-from utils.arg_parser import season_arg, season_type_arg
+from utils.utils import add_season_and_type, fill_nulls
+from utils.arg_parser import season_arg, season_type_arg, cache_arg, rate_limit_arg, hedge_arg, metrics_arg, stand_in_arg
 
-from database.db_constants import Tables, Columns
+from database.db_constants import Tables
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Pull NBA team game logs for given seasons and season type.')
     season_arg(parser)
     season_type_arg(parser)
+    cache_arg(parser)
+    rate_limit_arg(parser)
+    hedge_arg(parser)
+    metrics_arg(parser)
+    stand_in_arg(parser)
     return parser.parse_args()
 
 def main():
     args = parse_args()
+    smart.configure_cache(args.cache_dir, cache_only=args.cache_only)
+    smart.configure_rate_limit(args.rate_limit, shared_path=args.rate_limit_file)
+    smart.configure_hedging(args.hedge)
+    smart.configure_metrics(args.metrics_path)
+    smart.configure_stand_in(args.api_url, record_fixtures=args.record_fixtures)
     seasons = [s.strip() for s in args.season.split(',') if s.strip()]
     season_type = args.season_type
 
@@ -25,7 +35,6 @@ def main():
             continue
         # Add season and season_type columns
         df = add_season_and_type(df, season, season_type)
-        df = add_id(df, [Columns.GAME_ID, Columns.TEAM_ID])
         # Fill NaN/nulls
         df = fill_nulls(df)
         # Write to DB
@@ -32,3 +32,51 @@ def force_arg(parser):
 
 def delta_arg(parser):
     parser.add_argument('-d', '--delta', action='store_true', dest='delta', help='Delta Command')
+
+
+def cache_arg(parser):
+    parser.add_argument('-c', '--cache_dir', action="store", dest='cache_dir',
+                        help='Directory used to cache raw API responses between runs')
+    parser.add_argument('-co', '--cache_only', action='store_true', dest='cache_only',
+                        help='Only read API responses from the cache, never from the network')
+
+
+def concurrency_arg(parser):
+    parser.add_argument('-cc', '--concurrency', action="store", dest='concurrency', type=int, default=1,
+                        help='Number of API requests to run concurrently')
+
+
+def workers_arg(parser, default=1):
+    parser.add_argument('-w', '--workers', action="store", dest='workers', type=int, default=default,
+                        help=f'Number of games to process at once (default {default})')
+    parser.add_argument('-ex', '--executor', action="store", dest='executor', choices=['thread', 'process'],
+                        default='thread', help='Process games on worker threads or, for CPU bound work, processes')
+
+
+def stage_workers_arg(parser):
+    parser.add_argument('-sw', '--stage_workers', action="store", dest='stage_workers',
+                        help='Workers per pipeline stage, e.g. play_by_play=16,play_by_play_with_players=4')
+
+
+def rate_limit_arg(parser):
+    parser.add_argument('-r', '--rate_limit', action="store", dest='rate_limit', type=float,
+                        help='Starting number of API requests per second, adjusted when the API throttles')
+    parser.add_argument('-rf', '--rate_limit_file', action="store", dest='rate_limit_file',
+                        help='State file used to share the API request rate with other ETL processes on this host')
+
+
+def hedge_arg(parser):
+    parser.add_argument('-hg', '--hedge', action='store_true', dest='hedge',
+                        help='Resend API requests that are slower than the p95 latency of their endpoint')
+
+
+def metrics_arg(parser):
+    parser.add_argument('-m', '--metrics_path', action="store", dest='metrics_path',
+                        help='File the API metrics are written to at the end of the run (.json or Prometheus text)')
+
+
+def stand_in_arg(parser):
+    parser.add_argument('-au', '--api_url', action="store", dest='api_url',
+                        help='Base URL of the stats API, e.g. a local api.stand_in_server')
+    parser.add_argument('-rec', '--record_fixtures', action="store", dest='record_fixtures',
+                        help='Directory to record API responses to as fixtures for api.stand_in_server')
@@ -0,0 +1,89 @@
+# Game clock conversions. Work on scalars and on whole columns (Series or arrays) at once.
+
+import numpy as np
+import pandas as pd
+
+REGULATION_PERIODS = 4
+REGULATION_PERIOD_SECONDS = 12 * 60
+OVERTIME_PERIOD_SECONDS = 5 * 60
+# Rotations report IN_TIME_REAL and OUT_TIME_REAL in tenths of a second from the start of the game
+TENTHS_PER_SECOND = 10
+
+
+def period_length(period):
+    """
+    Returns the length of the period in seconds: 12 minutes in regulation, 5 minutes in overtime.
+    """
+    return np.where(np.asarray(period) <= REGULATION_PERIODS, REGULATION_PERIOD_SECONDS, OVERTIME_PERIOD_SECONDS)
+
+
+def period_start(period):
+    """
+    Returns the seconds from the start of the game at which the period starts.
+    """
+    period = np.asarray(period, dtype=np.int64)
+    regulation = (np.minimum(period, REGULATION_PERIODS + 1) - 1) * REGULATION_PERIOD_SECONDS
+    overtime = np.maximum(period - REGULATION_PERIODS - 1, 0) * OVERTIME_PERIOD_SECONDS
+    return regulation + overtime
+
+
+def get_period_time_bounds(period):
+    """
+    Returns (start, end) of the period in tenths of a second from the start of the game.
+    """
+    start = period_start(period)
+    end = start + period_length(period)
+    if np.ndim(start) == 0:
+        return int(start) * TENTHS_PER_SECOND, int(end) * TENTHS_PER_SECOND
+    return start * TENTHS_PER_SECOND, end * TENTHS_PER_SECOND
+
+
+def clock_to_seconds(clock):
+    """
+    Converts 'MM:SS' game clock strings (time left in the period) to seconds.
+    """
+    if isinstance(clock, str):
+        minutes, seconds = clock.split(':')
+        return int(minutes) * 60 + int(seconds)
+    # Parse the characters' code points as a (rows, 8) array instead of splitting each string. Strings are padded
+    # with zeros on the right, so the seconds are the two characters before the padding and the minutes the one or
+    # two characters before the colon. Anything longer than 'MM:SS' has more than 5 characters and is rejected.
+    text = np.asarray(clock, dtype='U8')
+    rows = np.arange(len(text))
+    codes = text.view(np.uint32).reshape(len(text), 8).astype(np.int64)
+    length = np.count_nonzero(codes, axis=1)
+    digits = codes - ord('0')
+    positions = np.arange(8)
+    colon = positions == (length - 3)[:, None]
+    valid = ((length == 4) | (length == 5)) & (codes[rows, length - 3] == ord(':'))
+    valid &= (colon | (positions >= length[:, None]) | ((digits >= 0) & (digits <= 9))).all(axis=1)
+    if not valid.all():
+        raise ValueError(f"Game clock values are not 'MM:SS': {text[~valid][:5].tolist()}")
+    seconds = digits[rows, length - 2] * 10 + digits[rows, length - 1]
+    minutes = np.where(length == 5, digits[:, 0] * 10 + digits[:, 1], digits[:, 0])
+    return minutes * 60 + seconds
+
+
+def seconds_from_start(period, clock):
+    """
+    Returns the seconds from the start of the game for a period and 'MM:SS' time left in it. Given columns, returns
+    a column: a Series with clock's index if clock is a Series.
+    """
+    seconds = period_start(period) + period_length(period) - clock_to_seconds(clock)
+    if isinstance(clock, pd.Series):
+        return pd.Series(seconds, index=clock.index)
+    return int(seconds) if np.ndim(seconds) == 0 else seconds
+
+
+def tenths_from_start(period, clock):
+    """
+    seconds_from_start in tenths of a second, the units of the rotations IN_TIME_REAL and OUT_TIME_REAL.
+    """
+    return seconds_from_start(period, clock) * TENTHS_PER_SECOND
+
+
+def convert_time_to_seconds(period, time_str):
+    """
+    Converts 'MM:SS' to seconds from game start for a given period.
+    """
+    return seconds_from_start(int(period), time_str)
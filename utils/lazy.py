@@ -0,0 +1,84 @@
+import os
+import threading
+import weakref
+
+_instances = weakref.WeakSet()
+
+
+class Lazy:
+    """
+    Stands in for a module level client that is expensive to build (a database engine, an HTTP session). The client
+    is built by factory() on first attribute access, so importing a module that defines one costs nothing and
+    `--help` or an argument error never builds it.
+
+    Each process has its own client. In a forked child, after_fork(client) is called on the inherited client so it
+    can drop connections and threads it shares with the parent while keeping its configuration; without after_fork
+    the child builds a new client on first use.
+    """
+
+    def __init__(self, factory, after_fork=None):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_after_fork', after_fork)
+        object.__setattr__(self, '_instance', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+        _instances.add(self)
+
+    def get(self):
+        """
+        Returns the client, building it on first use.
+        """
+        instance = self._instance
+        if instance is not None:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                object.__setattr__(self, '_instance', self._factory())
+            return self._instance
+
+    @property
+    def built(self):
+        return self._instance is not None
+
+    def configure(self, factory):
+        """
+        Replaces the factory, e.g. to build the client with other settings. Fails once the client has been built.
+        """
+        with self._lock:
+            if self._instance is not None:
+                raise Exception("Client is already built, configure it before first use")
+            object.__setattr__(self, '_factory', factory)
+
+    def reset(self):
+        """
+        Forgets the client so the next use builds a new one.
+        """
+        with self._lock:
+            object.__setattr__(self, '_instance', None)
+
+    def _in_child(self):
+        # The parent may have held the lock while forking
+        object.__setattr__(self, '_lock', threading.Lock())
+        if self._instance is None:
+            return
+        if self._after_fork is None:
+            object.__setattr__(self, '_instance', None)
+        else:
+            self._after_fork(self._instance)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
+
+    def __repr__(self):
+        return f'<Lazy {self._instance!r}>' if self.built else '<Lazy (not built)>'
+
+
+def _after_fork_in_child():
+    for lazy in list(_instances):
+        lazy._in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
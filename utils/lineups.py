@@ -0,0 +1,132 @@
+# Assigns the players on court for each team to every play by play event of a game.
+
+import json
+
+import numpy as np
+
+from database.db_constants import Columns
+from utils.clock import TENTHS_PER_SECOND
+
+SUBSTITUTION = 8
+START_OF_PERIOD = 12
+PLAYERS_ON_COURT = 5
+
+
+class TeamStints:
+    """
+    A team's rotation stints as sorted arrays of IN_TIME_REAL and OUT_TIME_REAL (tenths of a second from the start of
+    the game) with the player of each stint, so the players entering or leaving at a time are found by binary search
+    instead of scanning every player's stints.
+    """
+
+    def __init__(self, team_rot):
+        player_ids = []
+        ins = []
+        outs = []
+        for player_id, stints in zip(team_rot[Columns.PLAYER_ID], team_rot[Columns.STINTS]):
+            if not isinstance(stints, list):
+                stints = json.loads(stints)
+            for stint in stints:
+                player_ids.append(player_id)
+                ins.append(stint[Columns.IN_TIME_REAL])
+                outs.append(stint[Columns.OUT_TIME_REAL])
+        player_ids = np.array(player_ids, dtype=object)
+        ins = np.array(ins, dtype=np.float64)
+        outs = np.array(outs, dtype=np.float64)
+        # Stable sorts keep the rotations' player order among stints at the same time
+        in_order = np.argsort(ins, kind='stable')
+        out_order = np.argsort(outs, kind='stable')
+        self.ins = ins[in_order]
+        self.in_players = player_ids[in_order]
+        self.outs = outs[out_order]
+        self.out_players = player_ids[out_order]
+
+    @staticmethod
+    def _at(times, players, tenths):
+        start = np.searchsorted(times, tenths, side='left')
+        end = np.searchsorted(times, tenths, side='right')
+        # A player with two stints starting (or ending) at the same time is listed once
+        return list(dict.fromkeys(players[start:end].tolist()))
+
+    def entering(self, tenths):
+        return self._at(self.ins, self.in_players, tenths)
+
+    def leaving(self, tenths):
+        return self._at(self.outs, self.out_players, tenths)
+
+    def starters(self):
+        return sorted(self.entering(0))
+
+
+def apply_substitution(team_players, out_id, in_id, eventnum):
+    if out_id not in team_players:
+        raise Exception(f"ROW: {eventnum} Player {out_id} not found in current team players: {team_players}")
+    team_players = list(team_players)
+    team_players[team_players.index(out_id)] = in_id
+    team_players.sort()
+    return team_players
+
+
+def apply_stint_change(team_players, stints, tenths):
+    # Remove players whose stint ends at the time, add those whose stint starts at it
+    team_players = list(team_players)
+    for pid in stints.leaving(tenths):
+        if pid in team_players:
+            team_players.remove(pid)
+    for pid in stints.entering(tenths):
+        if pid not in team_players:
+            team_players.append(pid)
+    team_players.sort()
+    return team_players
+
+
+def assign_lineups(pbp, team1, team2, team1_stints, team2_stints, period_starters):
+    """
+    Returns a (len(pbp), 10) object array with the five players on court for team1 then team2 at every event of pbp,
+    which must be sorted in game order with a SECONDS_FROM_START column.
+
+    Lineups only change at substitutions and at the start of each period, a few dozen events a game. The lineup is
+    worked out at those events only, then every event gets the lineup of the last change at or before it with one
+    searchsorted. At the start of a period the players whose stints end or start then are swapped; if that does not
+    leave five players, period_starters(team_id, period) gives the period's starters (or None).
+    """
+    change_rows = np.flatnonzero(pbp[Columns.EVENTMSGTYPE].isin([SUBSTITUTION, START_OF_PERIOD]).to_numpy())
+    # Only the change events' values are needed, as plain lists rather than per row pandas lookups
+    columns = [Columns.EVENTMSGTYPE, Columns.PLAYER1_ID, Columns.PLAYER2_ID, Columns.PLAYER1_TEAM_ID,
+               Columns.EVENTNUM, Columns.SECONDS_FROM_START, Columns.PERIOD]
+    changes = zip(change_rows.tolist(), *(pbp[column].to_numpy()[change_rows].tolist() for column in columns))
+
+    current = [team1_stints.starters(), team2_stints.starters()]
+    lineups = np.empty((len(change_rows) + 1, 2 * PLAYERS_ON_COURT), dtype=object)
+    # The starters are only used by the events before the first change, usually there are none: the game starts with
+    # the start of period 1
+    if len(pbp) and (len(change_rows) == 0 or change_rows[0] > 0):
+        lineups[0] = _on_court(current, pbp, 0)
+    for change, (position, event_type, out_id, in_id, team_id, eventnum, seconds, period) in enumerate(changes, 1):
+        if event_type == SUBSTITUTION:
+            if team_id == team1:
+                current[0] = apply_substitution(current[0], out_id, in_id, eventnum)
+            elif team_id == team2:
+                current[1] = apply_substitution(current[1], out_id, in_id, eventnum)
+        else:
+            tenths = seconds * TENTHS_PER_SECOND
+            for i, (team_id, stints) in enumerate([(team1, team1_stints), (team2, team2_stints)]):
+                players = apply_stint_change(current[i], stints, tenths)
+                if len(players) != PLAYERS_ON_COURT:
+                    players = period_starters(int(team_id), period)
+                    if players is None:
+                        raise Exception(f"No players on court found for team {team_id} at the start of period {period}")
+                current[i] = players
+        lineups[change] = _on_court(current, pbp, position)
+
+    # Row r gets the lineup after the last change at or before r, or the starters before the first change
+    which = np.searchsorted(change_rows, np.arange(len(pbp)), side='right')
+    return lineups[which]
+
+
+def _on_court(current, pbp, position):
+    for players in current:
+        if len(players) < PLAYERS_ON_COURT:
+            eventnum = pbp[Columns.EVENTNUM].iloc[position]
+            raise Exception(f"ROW: {eventnum} Only {len(players)} players on court: {players}")
+    return current[0][:PLAYERS_ON_COURT] + current[1][:PLAYERS_ON_COURT]
@@ -1,30 +1,18 @@
-def check_duplicate_ids(df, id_col="id"):
+def check_duplicate_keys(df, key_cols):
     """
-    Checks for duplicate values in the specified id column of a DataFrame.
-    Prints the duplicate ids and raises an Exception if any are found.
+    Checks for duplicate primary keys (values of key_cols) in a DataFrame.
+    Prints the duplicate keys and raises an Exception if any are found.
     """
-    dupes = df[df.index.duplicated(keep=False)]
+    dupes = df[df.duplicated(subset=key_cols, keep=False)]
     if not dupes.empty:
-        print(f"Duplicate IDs found in index '{id_col}':")
-        print(dupes.index.unique())
-        raise Exception(f"Duplicate IDs found in index '{id_col}'!")
+        print(f"Duplicate keys found in {key_cols}:")
+        print(dupes[key_cols].drop_duplicates())
+        raise Exception(f"Duplicate keys found in {key_cols}!")
 
-import time
 import pandas as pd
 from api.smart import SeasonType
 from database.db_constants import Columns
 
-SLEEP_TIME = 0.01
-
-def convert_time_to_seconds(period, time_str):
-    """
-    Converts 'MM:SS' to seconds from game start for a given period.
-    """
-    minutes, seconds = map(int, time_str.split(':'))
-    if int(period) <= 4:
-        return (int(period) - 1) * 12 * 60 + (12 * 60 - (minutes * 60 + seconds))
-    else:
-        return 4 * 12 * 60 + (int(period) - 5) * 5 * 60 + (5 * 60 - (minutes * 60 + seconds))
 def fill_nulls(df):
     """
     Fill NaN/nulls in a DataFrame: numeric columns get 0.0, others get None.
@@ -54,15 +42,6 @@ def add_season_and_type(df, season, season_type):
     return add_season_type(add_season(df, season), season_type)
 
 
-def add_id(df, cols):
-    df['id'] = df[cols].astype(str).agg('-'.join, axis=1)
-    df = df.set_index('id')
-    return df
-
-def api_rate_limit():
-    time.sleep(SLEEP_TIME)
-
-
 def extract_season_from_game_id(game_id):
     season_start = int(game_id[3:5])
     season_end = season_start + 1
@@ -0,0 +1,101 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+THREAD = 'thread'
+PROCESS = 'process'
+EXECUTORS = [THREAD, PROCESS]
+
+
+def _ready():
+    return True
+
+
+class Workers:
+    """
+    Runs a per game (or per batch of games) function on a pool of threads or processes and hands each result back
+    to the caller as soon as it finishes, e.g. to put on a WriteBehindWriter in the parent.
+
+    Threads suit network bound work. CPU bound pandas work holds the GIL, so it needs processes: they are forked,
+    and the lazily built database_client and smart of the parent are rebuilt in each worker on first use (utils.lazy)
+    so every worker has its own connections while keeping the parent's configuration. fn and its results must be
+    picklable in process mode.
+
+    map keeps at most 2 * workers tasks in flight, so results don't pile up in memory when the caller is slower.
+    With one thread worker, map runs tasks inline in the calling thread.
+    """
+
+    def __init__(self, workers=1, executor=THREAD):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, must be one of {EXECUTORS}")
+        if workers < 1:
+            raise ValueError("Must have at least one worker")
+        self.workers = workers
+        self.executor = executor
+        self._pool = None
+
+    @property
+    def inline(self):
+        return self.executor == THREAD and self.workers == 1
+
+    def start(self):
+        """
+        Starts the pool. Start it before starting other threads (e.g. a WriteBehindWriter): workers are forked, and a
+        thread holding a lock while the process forks leaves that lock held in the worker.
+        """
+        if self._pool is not None:
+            return self
+        if self.executor == PROCESS:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            # The first task forks every worker
+            self._pool.submit(_ready).result()
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='etl-worker')
+        return self
+
+    def submit(self, fn, *args):
+        """
+        Runs fn(*args) on the pool and returns its Future. Unlike map, never runs inline.
+        """
+        self.start()
+        return self._pool.submit(fn, *args)
+
+    def map(self, fn, tasks):
+        """
+        Runs fn(*task) for every task (a tuple of arguments) and yields (task, result, error) as tasks finish, with
+        error the exception fn raised or None.
+        """
+        if self.inline:
+            for task in tasks:
+                try:
+                    yield task, fn(*task), None
+                except Exception as e:
+                    yield task, None, e
+            return
+
+        self.start()
+        tasks = iter(tasks)
+        pending = {}
+        while True:
+            for task in tasks:
+                pending[self._pool.submit(fn, *task)] = task
+                if len(pending) >= 2 * self.workers:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = pending.pop(future)
+                error = future.exception()
+                yield task, None if error is not None else future.result(), error
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False